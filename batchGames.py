@@ -0,0 +1,330 @@
+# batchGames.py
+# -------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+A NumPy engine that plays many classic games on one layout in lockstep.
+
+BatchGames keeps the state of N games as arrays (positions, directions,
+scared timers, food and capsule masks, scores) and applies the rules of
+PacmanRules and GhostRules to every unfinished game at once.  Only the
+simple built-in agents are available, as vectorised policies:
+
+  pacman: RandomAgent, OneStepLookAheadAgent
+  ghosts: RandomGhost, DirectionalGhost
+
+Positions are stored in half-cell units so that scared ghosts, which move
+half a cell per turn, stay on integers.  Random draws come from a NumPy
+generator, so a batch reproduces the statistics of runGames, not its exact
+games.  To play 1000 games from the command line:
+
+> python batchGames.py -l smallClassic -p RandomAgent -g DirectionalGhost -n 1000
+
+NumPy is only needed by this module.
+"""
+
+from game import Directions
+import pacman
+import layout
+import numpy as np
+import sys, time
+
+DIRECTIONS = [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST, Directions.STOP]
+STOP = 4
+VECTORS = np.array([(0, 1), (0, -1), (1, 0), (-1, 0), (0, 0)])
+MOVE_BITS = np.arange(4)
+
+# For a mask of legal direction indices: how many are set, and the r-th one set.
+BIT_COUNT = np.array([bin(mask).count('1') for mask in range(32)])
+NTH_BIT = np.array([([i for i in range(5) if mask & (1 << i)] + [STOP] * 5)[:5] for mask in range(32)])
+
+class BatchLayout:
+    """
+    The per-layout tables BatchGames needs, derived from Layout.getMoveTable.
+    """
+    def __init__(self, layout, numGhosts):
+        self.layout = layout
+        self.width = layout.width
+        self.height = layout.height
+        numCells = layout.width * layout.height
+        moveTable = layout.getMoveTable()
+
+        # Bit d of pacmanMask[cell] is set if pacman may take DIRECTIONS[d] there,
+        # and likewise for ghostMask[cell, heading].
+        self.pacmanMask = np.zeros(numCells, dtype=np.int64)
+        self.ghostMask = np.zeros((numCells, 5), dtype=np.int64)
+        for (x, y), actions in moveTable.actions.items():
+            cell = x * layout.height + y
+            self.pacmanMask[cell] = self._mask(actions)
+            for heading, direction in enumerate(DIRECTIONS):
+                self.ghostMask[cell, heading] = self._mask(moveTable.ghostActions[((x, y), direction)])
+
+        self.food = np.zeros(numCells, dtype=bool)
+        for x, y in layout.food.asList():
+            self.food[x * layout.height + y] = True
+        self.capsuleIndex = -np.ones(numCells, dtype=np.int64)
+        for i, (x, y) in enumerate(layout.capsules):
+            self.capsuleIndex[x * layout.height + y] = i
+        self.numCapsules = len(layout.capsules)
+
+        # Same agent selection as GameStateData.initialize
+        starts = []
+        ghosts = 0
+        for isPacman, pos in layout.agentPositions:
+            if not isPacman:
+                if ghosts == numGhosts: continue
+                ghosts += 1
+            starts.append((pos[0] * 2, pos[1] * 2))
+        self.starts = np.array(starts)
+        self.numAgents = len(starts)
+
+    def _mask(self, actions):
+        mask = 0
+        for action in actions:
+            mask |= 1 << DIRECTIONS.index(action)
+        return mask
+
+class BatchGames(object):
+    """
+    The state of N games on one BatchLayout.  Every method that changes the
+    games takes idx, an array of the game indices it applies to.
+    """
+    def __init__(self, batchLayout, numGames, seed=None):
+        self.batchLayout = batchLayout
+        self.random = np.random.RandomState(seed)
+        self.numGames = numGames
+        numAgents = batchLayout.numAgents
+        self.pos = np.tile(batchLayout.starts, (numGames, 1, 1))
+        self.direction = np.full((numGames, numAgents), STOP, dtype=np.int64)
+        self.scared = np.zeros((numGames, numAgents), dtype=np.int64)
+        self.food = np.tile(batchLayout.food, (numGames, 1))
+        self.numFood = self.food.sum(axis=1)
+        self.capsules = np.ones((numGames, batchLayout.numCapsules), dtype=bool)
+        self.score = np.zeros(numGames, dtype=np.int64)
+        self.win = np.zeros(numGames, dtype=bool)
+        self.lose = np.zeros(numGames, dtype=bool)
+        self.moves = np.zeros(numGames, dtype=np.int64)
+
+    def take(self, idx):
+        """
+        Returns a new BatchGames holding copies of the games in idx, for looking ahead.
+        """
+        games = BatchGames.__new__(BatchGames)
+        games.batchLayout = self.batchLayout
+        games.random = self.random
+        games.numGames = len(idx)
+        for name in ['pos', 'direction', 'scared', 'food', 'numFood', 'capsules', 'score', 'win', 'lose', 'moves']:
+            setattr(games, name, getattr(self, name)[idx].copy())
+        return games
+
+    def active(self):
+        return np.nonzero(~(self.win | self.lose))[0]
+
+    def cell(self, idx, agentIndex):
+        pos = self.pos[idx, agentIndex]
+        return (pos[:, 0] // 2) * self.batchLayout.height + pos[:, 1] // 2
+
+    def pacmanMask(self, idx):
+        return self.batchLayout.pacmanMask[self.cell(idx, 0)]
+
+    def ghostMask(self, idx, agentIndex):
+        """
+        Legal ghost directions; between grid points a ghost must continue straight.
+        """
+        heading = self.direction[idx, agentIndex]
+        onGrid = (self.pos[idx, agentIndex] % 2 == 0).all(axis=1)
+        cell = np.where(onGrid, self.cell(idx, agentIndex), 0)
+        return np.where(onGrid, self.batchLayout.ghostMask[cell, heading], 1 << heading)
+
+    def chooseUniform(self, masks):
+        choice = (self.random.random_sample(len(masks)) * BIT_COUNT[masks]).astype(np.int64)
+        return NTH_BIT[masks, choice]
+
+    def movePacman(self, idx, actions):
+        """
+        PacmanRules.applyAction, then the time penalty and GhostRules.checkDeath.
+        """
+        actions = np.where((self.pacmanMask(idx) >> actions) & 1 == 1, actions, STOP)
+        self.pos[idx, 0] += VECTORS[actions] * 2
+        moving = actions != STOP
+        self.direction[idx[moving], 0] = actions[moving]
+
+        cell = self.cell(idx, 0)
+        eats = self.food[idx, cell]
+        eaters = idx[eats]
+        self.food[eaters, cell[eats]] = False
+        self.score[eaters] += 10
+        self.numFood[eaters] -= 1
+        winners = eaters[(self.numFood[eaters] == 0) & ~self.lose[eaters]]
+        self.score[winners] += 500
+        self.win[winners] = True
+
+        capsule = self.batchLayout.capsuleIndex[cell]
+        onCapsule = capsule >= 0
+        onCapsule[onCapsule] = self.capsules[idx[onCapsule], capsule[onCapsule]]
+        eaters = idx[onCapsule]
+        self.capsules[eaters, capsule[onCapsule]] = False
+        self.scared[eaters, 1:] = pacman.SCARED_TIME
+
+        self.score[idx] -= pacman.TIME_PENALTY
+        for agentIndex in range(1, self.batchLayout.numAgents):
+            self.checkDeath(idx, agentIndex)
+
+    def moveGhost(self, idx, agentIndex, actions):
+        """
+        GhostRules.applyAction, decrementTimer and checkDeath.
+        """
+        scared = self.scared[idx, agentIndex]
+        speed = np.where(scared > 0, 1, 2)
+        self.pos[idx, agentIndex] += VECTORS[actions] * speed[:, None]
+        self.direction[idx, agentIndex] = actions
+
+        snap = idx[scared == 1]
+        self.pos[snap, agentIndex] = (self.pos[snap, agentIndex] + 1) // 2 * 2
+        self.scared[idx, agentIndex] = np.maximum(0, scared - 1)
+        self.checkDeath(idx, agentIndex)
+
+    def checkDeath(self, idx, agentIndex):
+        distance = np.abs(self.pos[idx, agentIndex] - self.pos[idx, 0]).sum(axis=1)
+        hit = idx[distance <= 2 * pacman.COLLISION_TOLERANCE]
+        scared = self.scared[hit, agentIndex] > 0
+        eaten = hit[scared]
+        self.score[eaten] += 200
+        self.pos[eaten, agentIndex] = self.batchLayout.starts[agentIndex]
+        self.direction[eaten, agentIndex] = STOP
+        self.scared[eaten, agentIndex] = 0
+        killers = hit[~scared]
+        killers = killers[~self.win[killers]]
+        self.score[killers] -= 500
+        self.lose[killers] = True
+
+    def run(self, pacmanPolicy, ghostPolicy, maxMoves=1000):
+        """
+        Plays every game to the end, or for maxMoves pacman moves.
+        """
+        numAgents = self.batchLayout.numAgents
+        while True:
+            for agentIndex in range(numAgents):
+                idx = self.active()
+                idx = idx[self.moves[idx] < maxMoves]
+                if len(idx) == 0: return
+                if agentIndex == 0:
+                    self.movePacman(idx, pacmanPolicy(self, idx))
+                    self.moves[idx] += 1
+                else:
+                    self.moveGhost(idx, agentIndex, ghostPolicy(self, idx, agentIndex))
+
+    def results(self):
+        """
+        A (score, win, moves) tuple per game.
+        """
+        return zip([float(score) for score in self.score], [bool(w) for w in self.win], [int(m) for m in self.moves])
+
+#####################
+# Vectorised agents #
+#####################
+
+def randomPacman(games, idx):
+    "pacmanAgents.RandomAgent"
+    return games.chooseUniform(games.pacmanMask(idx) & ~(1 << STOP))
+
+def oneStepLookAheadPacman(games, idx):
+    "pacmanAgents.OneStepLookAheadAgent: the successor with the lowest admissibleHeuristic"
+    legal = games.pacmanMask(idx) & ~(1 << STOP)
+    values = np.full((len(idx), 4), np.inf)
+    for action in range(4):
+        has = (legal >> action) & 1 == 1
+        if not has.any(): continue
+        sim = games.take(idx[has])
+        simIdx = np.arange(sim.numGames)
+        sim.movePacman(simIdx, np.full(sim.numGames, action, dtype=np.int64))
+        for agentIndex in range(1, sim.batchLayout.numAgents):
+            simIdx = sim.active()
+            sim.moveGhost(simIdx, agentIndex, sim.chooseUniform(sim.ghostMask(simIdx, agentIndex)))
+        values[has, action] = np.where(sim.lose, 1000.0, sim.numFood + sim.capsules.sum(axis=1))
+    best = values == values.min(axis=1)[:, None]
+    return games.chooseUniform((best * (1 << MOVE_BITS)).sum(axis=1))
+
+def randomGhost(games, idx, agentIndex):
+    "ghostAgents.RandomGhost"
+    return games.chooseUniform(games.ghostMask(idx, agentIndex))
+
+def directionalGhost(games, idx, agentIndex, prob_attack=0.8, prob_scaredFlee=0.8):
+    "ghostAgents.DirectionalGhost"
+    legal = (games.ghostMask(idx, agentIndex)[:, None] >> MOVE_BITS) & 1 == 1
+    scared = games.scared[idx, agentIndex] > 0
+    speed = np.where(scared, 1, 2)
+    newPositions = games.pos[idx, agentIndex][:, None, :] + VECTORS[None, :4] * speed[:, None, None]
+    distances = np.abs(newPositions - games.pos[idx, 0][:, None, :]).sum(axis=2)
+    nearest = np.where(legal, distances, sys.maxint).min(axis=1)
+    furthest = np.where(legal, distances, -1).max(axis=1)
+    best = legal & (distances == np.where(scared, furthest, nearest)[:, None])
+    bestProb = np.where(scared, prob_scaredFlee, prob_attack)
+    dist = best * (bestProb / best.sum(axis=1))[:, None] + legal * ((1 - bestProb) / legal.sum(axis=1))[:, None]
+    cumulative = dist.cumsum(axis=1)
+    draw = games.random.random_sample(len(idx)) * cumulative[:, -1]
+    return np.minimum((cumulative < draw[:, None]).sum(axis=1), 3)
+
+PACMAN_POLICIES = {'RandomAgent': randomPacman, 'OneStepLookAheadAgent': oneStepLookAheadPacman}
+GHOST_POLICIES = {'RandomGhost': randomGhost, 'DirectionalGhost': directionalGhost}
+
+def runBatch( layout, pacmanName, ghostName, numGames, numGhosts=4, seed=None, maxMoves=1000 ):
+    """
+    Plays numGames games and returns their (score, win, moves) results.
+    """
+    if pacmanName not in PACMAN_POLICIES:
+        raise Exception('The agent ' + pacmanName + ' has no batch policy; use one of ' + ', '.join(PACMAN_POLICIES.keys()))
+    if ghostName not in GHOST_POLICIES:
+        raise Exception('The ghost ' + ghostName + ' has no batch policy; use one of ' + ', '.join(GHOST_POLICIES.keys()))
+    games = BatchGames(BatchLayout(layout, numGhosts), numGames, seed)
+    games.run(PACMAN_POLICIES[pacmanName], GHOST_POLICIES[ghostName], maxMoves)
+    return games.results()
+
+def readCommand( argv ):
+    from optparse import OptionParser
+    usageStr = """
+    USAGE:      python batchGames.py <options>
+    EXAMPLE:    python batchGames.py -l smallClassic -p OneStepLookAheadAgent -n 1000
+    """
+    parser = OptionParser(usageStr)
+    parser.add_option('-n', '--numGames', dest='numGames', type='int',
+                      help=pacman.default('the number of GAMES to play'), metavar='GAMES', default=1000)
+    parser.add_option('-l', '--layout', dest='layout',
+                      help=pacman.default('the LAYOUT_FILE from which to load the map layout'),
+                      metavar='LAYOUT_FILE', default='smallClassic')
+    parser.add_option('-p', '--pacman', dest='pacman',
+                      help=pacman.default('the pacman agent TYPE to simulate'),
+                      metavar='TYPE', default='RandomAgent')
+    parser.add_option('-g', '--ghosts', dest='ghost',
+                      help=pacman.default('the ghost agent TYPE to simulate'),
+                      metavar = 'TYPE', default='RandomGhost')
+    parser.add_option('-k', '--numghosts', type='int', dest='numGhosts',
+                      help=pacman.default('The maximum number of ghosts to use'), default=4)
+    parser.add_option('-s', '--seed', type='int', dest='seed',
+                      help='The random seed', default=None)
+    parser.add_option('-m', '--maxMoves', type='int', dest='maxMoves',
+                      help=pacman.default('Pacman moves after which an unfinished game counts as a loss'), default=1000)
+    options, otherjunk = parser.parse_args(argv)
+    if len(otherjunk) != 0:
+        raise Exception('Command line input not understood: ' + str(otherjunk))
+    return options
+
+if __name__ == '__main__':
+    options = readCommand( sys.argv[1:] )
+    lay = layout.getLayout( options.layout )
+    if lay == None: raise Exception("The layout " + options.layout + " cannot be found")
+    startTime = time.time()
+    results = runBatch( lay, options.pacman, options.ghost, options.numGames, options.numGhosts, options.seed, options.maxMoves )
+    elapsed = time.time() - startTime
+    pacman.printSummary( [score for score, win, moves in results], [win for score, win, moves in results] )
+    print 'Played %d games in %.2fs (%.0f games/s)' % (len(results), elapsed, len(results) / elapsed)
@@ -0,0 +1,810 @@
+# benchmarks.py
+# -------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+Micro-benchmarks for the game engine and the search agents.
+
+Each benchmark is a function taking the parsed command line options and
+printing one line per measurement.  Run one with
+
+> python benchmarks.py successors -l mediumClassic -l originalClassic
+
+and see 'python benchmarks.py --help' for the list of benchmarks.
+"""
+
+from pacman import GameState
+from game import Directions
+import layout
+import sys, time, random
+
+def loadLayout(name):
+    lay = layout.getLayout(name)
+    if lay == None: raise Exception("The layout " + name + " cannot be found")
+    return lay
+
+def initialState(lay, numGhosts=4):
+    state = GameState()
+    state.initialize(lay, numGhosts)
+    return state
+
+def expandPly(state):
+    """
+    Expands every pacman action of state followed by one random move for each
+    ghost, like GameState.generatePacmanSuccessor but without the iteration
+    budget.  Returns the children and the number of generateSuccessor calls.
+    """
+    children = []
+    calls = 0
+    for action in state.getLegalPacmanActions():
+        child = state.generateSuccessor(0, action)
+        calls += 1
+        for i in range(1, child.getNumAgents()):
+            if child.isWin() or child.isLose(): break
+            actions = child.getLegalActions(i)
+            child = child.generateSuccessor(i, random.choice(actions))
+            calls += 1
+        children.append(child)
+    return children, calls
+
+def benchmarkSuccessors(options):
+    """
+    Breadth-first expansion from the start state; reports generateSuccessor
+    calls per second.
+    """
+    for name in options.layouts:
+        random.seed(options.seed)
+        start = initialState(loadLayout(name), options.numGhosts)
+        frontier = [start]
+        calls = 0
+        startTime = time.time()
+        while calls < options.count and len(frontier) > 0:
+            nextFrontier = []
+            for state in frontier:
+                if state.isWin() or state.isLose(): continue
+                children, n = expandPly(state)
+                nextFrontier.extend(children)
+                calls += n
+                if calls >= options.count: break
+            frontier = nextFrontier
+        elapsed = time.time() - startTime
+        print '%-16s %8d successors %8.3fs %10.0f successors/s' % (name, calls, elapsed, calls / elapsed)
+
+def benchmarkGrids(options):
+    """
+    Times copy, count, hash and asList of each layout's food grid on the list
+    backed Grid and on BitGrid.
+    """
+    from game import Grid, BitGrid
+    for name in options.layouts:
+        food = loadLayout(name).food
+        for gridType in [Grid, BitGrid]:
+            grid = gridType(food.width, food.height)
+            for x, y in food.asList(): grid[x][y] = True
+            timings = []
+            for operation in [grid.copy, grid.count, grid.__hash__, grid.asList]:
+                startTime = time.time()
+                for i in xrange(options.count // 10):
+                    operation()
+                timings.append((time.time() - startTime) * 1e6 / (options.count // 10))
+            print '%-16s %-8s copy %7.2fus  count %7.2fus  hash %7.2fus  asList %7.2fus' % tuple([name, gridType.__name__] + timings)
+
+def benchmarkHashing(options):
+    """
+    Hashes the states of a breadth-first expansion; reports the cost of hash()
+    and how many distinct states share a full hash or would share a 20-bit one.
+    """
+    for name in options.layouts:
+        random.seed(options.seed)
+        states = [initialState(loadLayout(name), options.numGhosts)]
+        frontier = states[:]
+        while len(states) < options.count and len(frontier) > 0:
+            nextFrontier = []
+            for state in frontier:
+                if state.isWin() or state.isLose(): continue
+                nextFrontier.extend(expandPly(state)[0])
+                if len(states) + len(nextFrontier) >= options.count: break
+            states.extend(nextFrontier)
+            frontier = nextFrontier
+        states = states[:options.count]
+
+        startTime = time.time()
+        hashes = [hash(state) for state in states]
+        elapsed = time.time() - startTime
+
+        buckets = {}
+        for h, state in zip(hashes, states):
+            bucket = buckets.setdefault(h, [])
+            if state not in bucket: bucket.append(state)
+        distinct = sum([len(bucket) for bucket in buckets.values()])
+        narrow = set([h % 1048575 for h in buckets.keys()])
+        print '%-16s %8d states %6.2fus/hash  %8d distinct  %6d full-hash collisions  %6d 20-bit collisions' % \
+            (name, len(states), elapsed * 1e6 / len(states), distinct, distinct - len(buckets), distinct - len(narrow))
+
+def benchmarkHeuristic(options):
+    """
+    Times heuristics.admissibleHeuristic over the states of a breadth-first
+    expansion.
+    """
+    from heuristics import admissibleHeuristic
+    for name in options.layouts:
+        random.seed(options.seed)
+        states = [initialState(loadLayout(name), options.numGhosts)]
+        frontier = states[:]
+        while len(states) < 2000 and len(frontier) > 0:
+            nextFrontier = []
+            for state in frontier:
+                if state.isWin() or state.isLose(): continue
+                nextFrontier.extend(expandPly(state)[0])
+            states.extend(nextFrontier)
+            frontier = nextFrontier
+        rounds = max(1, options.count // len(states))
+        startTime = time.time()
+        for i in xrange(rounds):
+            for state in states:
+                admissibleHeuristic(state)
+        elapsed = time.time() - startTime
+        print '%-16s %8d evaluations %6.3fus/evaluation' % (name, rounds * len(states), elapsed * 1e6 / (rounds * len(states)))
+
+def benchmarkExpansion(options):
+    """
+    Compares expanding every pacman action with generatePacmanSuccessor one
+    action at a time against one generatePacmanSuccessors call.
+    """
+    for name in options.layouts:
+        start = initialState(loadLayout(name), options.numGhosts)
+        for label in ['per-action', 'batched']:
+            random.seed(options.seed)
+            start.getContext().currentIterations = options.count + 1
+            frontier = [start]
+            expanded = 0
+            startTime = time.time()
+            while expanded < options.count and len(frontier) > 0:
+                state = frontier.pop(0)
+                if state.isWin() or state.isLose(): continue
+                legal = state.getLegalPacmanActions()
+                if label == 'batched':
+                    children = state.generatePacmanSuccessors(legal)
+                else:
+                    children = [state.generatePacmanSuccessor(action) for action in legal]
+                frontier.extend(children)
+                expanded += len(children)
+            elapsed = time.time() - startTime
+            print '%-16s %-10s %8d children %8.3fs %10.0f children/s' % (name, label, expanded, elapsed, expanded / elapsed)
+
+def playSerialGames(lay, pacmanType, ghostType, numGames, numGhosts):
+    """
+    Plays numGames quiet games with the regular engine and returns their
+    (score, win) results.
+    """
+    import pacman, textDisplay
+    rules = pacman.ClassicGameRules()
+    ghosts = [ghostType(i + 1) for i in range(numGhosts)]
+    results = []
+    for i in range(numGames):
+        game = rules.newGame(lay, pacmanType(), ghosts, textDisplay.NullGraphics(), True)
+        game.run()
+        results.append((game.state.getScore(), game.state.isWin()))
+    return results
+
+def benchmarkBatch(options):
+    """
+    Compares games per second of the regular engine (count / 100 games)
+    with batchGames.runBatch (count / 10 games).
+    """
+    import batchGames, pacmanAgents, ghostAgents
+    for name in options.layouts:
+        lay = loadLayout(name)
+        for pacmanName, ghostName in [('RandomAgent', 'RandomGhost'), ('OneStepLookAheadAgent', 'DirectionalGhost')]:
+            random.seed(options.seed)
+            numGames = max(1, options.count // 100)
+            startTime = time.time()
+            serial = playSerialGames(lay, getattr(pacmanAgents, pacmanName), getattr(ghostAgents, ghostName), numGames, options.numGhosts)
+            serialRate = numGames / (time.time() - startTime)
+
+            numGames = max(1, options.count // 10)
+            startTime = time.time()
+            batch = batchGames.runBatch(lay, pacmanName, ghostName, numGames, options.numGhosts, options.seed)
+            batchRate = numGames / (time.time() - startTime)
+            print '%-16s %-22s %-16s serial %7.1f games/s (avg %7.1f)  batch %8.1f games/s (avg %7.1f)  x%.0f' % \
+                (name, pacmanName, ghostName, serialRate, sum([r[0] for r in serial]) / len(serial),
+                 batchRate, sum([r[0] for r in batch]) / len(batch), batchRate / serialRate)
+
+def benchmarkObservation(options):
+    """
+    Times building the observation Game.run hands an agent each turn, as a
+    deep copy and as a read-only view, from states along a random game.
+    """
+    for name in options.layouts:
+        random.seed(options.seed)
+        state = initialState(loadLayout(name), options.numGhosts)
+        states = []
+        while len(states) < 200 and not (state.isWin() or state.isLose()):
+            for i in range(state.getNumAgents()):
+                if state.isWin() or state.isLose(): break
+                state = state.generateSuccessor(i, random.choice(state.getLegalActions(i)))
+                states.append(state)
+        rounds = max(1, options.count // (10 * len(states)))
+        for label in ['deepCopy', 'view']:
+            startTime = time.time()
+            for i in xrange(rounds):
+                for state in states:
+                    if label == 'view':
+                        state.makeObservation(0)
+                    else:
+                        state.deepCopy()
+            elapsed = time.time() - startTime
+            perObservation = elapsed * 1e6 / (rounds * len(states))
+            print '%-16s %-8s %6.2fus/observation %8.2fus/turn with %d agents' % (name, label, perObservation, perObservation * state.getNumAgents(), state.getNumAgents())
+
+def searchMemory(task):
+    """
+    Runs one AStarAgent search with a budget of count forward-model calls in
+    a fresh worker process; returns (nodes, seconds, starting and peak RSS).
+    """
+    import resource
+    from pacmanAgents import AStarAgent
+    name, count, numGhosts, seed = task
+    random.seed(seed)
+    state = initialState(loadLayout(name), numGhosts)
+    agent = AStarAgent()
+    agent.registerInitialState(state)
+    startRss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    context = state.getContext()
+    context.currentIterations = count + 1
+    startTime = time.time()
+    agent.getAction(state)
+    elapsed = time.time() - startTime
+    nodes = count + 1 - max(0, context.currentIterations)
+    return nodes, elapsed, startRss, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def benchmarkMemory(options):
+    """
+    Reports the peak RSS growth of an AStarAgent search per 100k search nodes,
+    each layout measured in its own process.
+    """
+    import multiprocessing
+    pool = multiprocessing.Pool(1, maxtasksperchild=1)
+    try:
+        for name in options.layouts:
+            nodes, elapsed, startRss, peakRss = pool.apply(searchMemory, [(name, options.count, options.numGhosts, options.seed)])
+            print '%-16s %8d nodes %8.3fs %10.0f nodes/s  peak RSS %7.1fMB  %7.1fMB/100k nodes' % \
+                (name, nodes, elapsed, nodes / elapsed, peakRss / 1024.0, (peakRss - startRss) / 1024.0 * 100000 / max(1, nodes))
+    finally:
+        pool.terminate()
+
+class LegacyPriorityQueue(object):
+    """
+    The recursive binary heap AStarAgent used before search.PriorityQueue,
+    kept for the 'queue' benchmark.  Entries are (totalCost, node, action).
+    """
+    def __init__(self):
+        self.data_list = [(None, None, None)]
+
+    def size(self):
+        return len(self.data_list) - 1
+
+    def left_child(self, root):
+        return root * 2
+
+    def right_child(self, root):
+        return root * 2 + 1
+
+    def father(self, node):
+        return node / 2
+
+    def heapify(self, root):
+        if root > self.size():
+            return
+        left_node = self.left_child(root)
+        right_node = self.right_child(root)
+        smallest = root
+        if left_node <= self.size():
+            if self.data_list[left_node][0] < self.data_list[smallest][0]:
+                smallest = left_node
+
+        if right_node <= self.size():
+            if self.data_list[right_node][0] < self.data_list[smallest][0]:
+                smallest = right_node
+
+        if smallest != root:
+            self.data_list[root], self.data_list[smallest] = self.data_list[smallest], self.data_list[root]
+            self.heapify(smallest)
+
+    def build_heap(self):
+        for i in range(self.size() / 2, 0, -1):
+            self.heapify(i)
+
+    def get(self):
+        if self.size() < 1:
+            return None
+        ret = self.data_list[1]
+        self.data_list[1] = self.data_list[-1]
+        del self.data_list[-1]
+        self.heapify(1)
+        return ret
+
+    def put(self, data):
+        self.data_list.append(data)
+        now_index = self.size()
+        pre = self.father(now_index)
+        while now_index > 1 and self.data_list[pre][0] > data[0]:
+            self.data_list[pre], self.data_list[now_index] = self.data_list[now_index], self.data_list[pre]
+            now_index = pre
+            pre = now_index / 2
+
+def benchmarkQueue(options):
+    """
+    Pushes count entries with random integer priorities, as A* produces, and
+    pops them all, on LegacyPriorityQueue and on search.PriorityQueue.
+    """
+    from search import PriorityQueue, StateNode
+    random.seed(options.seed)
+    priorities = [random.randint(0, 200) for i in xrange(options.count)]
+    nodes = [StateNode(None, 0) for i in xrange(options.count)]
+    for label in ['legacy', 'heapq']:
+        startTime = time.time()
+        if label == 'legacy':
+            queue = LegacyPriorityQueue()
+            for priority, node in zip(priorities, nodes):
+                queue.put((priority, node, None))
+            while queue.size() > 0:
+                queue.get()
+        else:
+            queue = PriorityQueue()
+            for priority, node in zip(priorities, nodes):
+                queue.put((node, None), priority)
+            while queue.size() > 0:
+                queue.get()
+        elapsed = time.time() - startTime
+        print '%-8s %8d entries %8.3fs %6.2fus/put+get' % (label, options.count, elapsed, elapsed * 1e6 / options.count)
+
+def benchmarkSearch(options):
+    """
+    Runs one search.SearchEngine search per frontier from the start state
+    with a budget of count forward-model calls; reports its counters.
+    """
+    from search import SearchEngine
+    for name in options.layouts:
+        start = initialState(loadLayout(name), options.numGhosts)
+        for frontier, frontierSize in [('fifo', 0), ('lifo', 0), ('priority', 0), ('beam', 100)]:
+            random.seed(options.seed)
+            engine = SearchEngine(frontier, frontierSize=frontierSize)
+            start.getContext().currentIterations = options.count + 1
+            startTime = time.time()
+            engine.search(start)
+            elapsed = time.time() - startTime
+            print '%-16s %-8s %8d expanded %8d generated %7d skipped %7d max frontier %8.3fs %9.0f nodes/s' % \
+                (name, frontier, engine.expanded, engine.generated, engine.skipped, engine.maxFrontier, elapsed, engine.generated / elapsed)
+
+class LatencyRecorder:
+    """
+    Wraps an agent and records how long each of its getAction calls takes.
+    """
+    def __init__(self, agent):
+        self.agent = agent
+        self.index = agent.index
+        self.latencies = []
+
+    def registerInitialState(self, state):
+        self.agent.registerInitialState(state)
+
+    def setTimeLeft(self, seconds):
+        self.agent.setTimeLeft(seconds)
+
+    def getAction(self, state):
+        startTime = time.time()
+        action = self.agent.getAction(state)
+        self.latencies.append(time.time() - startTime)
+        return action
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def benchmarkDeadline(options):
+    """
+    Plays 3 games of AStarAgent against DirectionalGhosts for each per-move
+    time budget, with count forward-model calls per move; reports the p50
+    and p99 getAction latency and the games' average score.
+    """
+    import pacman, textDisplay
+    from game import GameContext
+    from pacmanAgents import AStarAgent
+    from ghostAgents import DirectionalGhost
+    for name in options.layouts:
+        lay = loadLayout(name)
+        for moveTime in [0.005, 0.02, 0.1, 0]:
+            random.seed(options.seed)
+            rules = pacman.ClassicGameRules(3600)
+            recorder = LatencyRecorder(AStarAgent(moveTime=moveTime))
+            scores, wins = [], 0
+            for i in range(3):
+                ghosts = [DirectionalGhost(i + 1) for i in range(options.numGhosts)]
+                game = rules.newGame(lay, recorder, ghosts, textDisplay.NullGraphics(), True, context=GameContext(options.count, 3600))
+                game.run()
+                scores.append(game.state.getScore())
+                wins += game.state.isWin()
+            label = moveTime and '%gms' % (moveTime * 1000) or 'no limit'
+            print '%-16s %-8s p50 %7.2fms  p99 %7.2fms  max %7.2fms  %5d moves  avg score %7.1f  %d/3 wins' % \
+                (name, label, percentile(recorder.latencies, 0.5) * 1000, percentile(recorder.latencies, 0.99) * 1000,
+                 max(recorder.latencies) * 1000, len(recorder.latencies), sum(scores) / len(scores), wins)
+
+def benchmarkMCTS(options):
+    """
+    Plays 3 games of MCTSAgent against DirectionalGhosts per configuration of
+    per-move time and root-parallel workers, with count forward-model calls
+    per move; reports rollouts per second and the win rate.
+    """
+    import pacman, textDisplay
+    from game import GameContext
+    from pacmanAgents import MCTSAgent
+    from ghostAgents import DirectionalGhost
+    for name in options.layouts:
+        lay = loadLayout(name)
+        for moveTime, workers in [(0.02, 1), (0.1, 1), (0.1, 4)]:
+            random.seed(options.seed)
+            rules = pacman.ClassicGameRules(3600)
+            agent = MCTSAgent(moveTime=moveTime, workers=workers)
+            scores, wins, agentTime = [], 0, 0.0
+            for i in range(3):
+                ghosts = [DirectionalGhost(i + 1) for i in range(options.numGhosts)]
+                game = rules.newGame(lay, agent, ghosts, textDisplay.NullGraphics(), True, context=GameContext(options.count, 3600))
+                game.run()
+                scores.append(game.state.getScore())
+                wins += game.state.isWin()
+                agentTime += game.totalAgentTimes[0]
+            print '%-16s %5gms x%d  %5d searches %9.0f rollouts/s  avg score %7.1f  %d/3 wins' % \
+                (name, moveTime * 1000, workers, agent.mcts.searches, agent.mcts.rollouts / agentTime, sum(scores) / len(scores), wins)
+
+def bfsDistance(walls, a, b):
+    """
+    The maze distance a caller without layout.MazeDistances computes by
+    searching the walls grid on every query.
+    """
+    from collections import deque
+    seen = set([a])
+    queue = deque([(a, 0)])
+    while queue:
+        (x, y), d = queue.popleft()
+        if (x, y) == b: return d
+        for next in [(x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)]:
+            if next not in seen and not walls[next[0]][next[1]]:
+                seen.add(next)
+                queue.append((next, d + 1))
+    return None
+
+def benchmarkDistances(options):
+    """
+    Reports the build time and footprint of the maze-distance table of each
+    layout, the time to map it back from the disk cache, and the cost of a
+    lookup against a breadth-first search per query.
+    """
+    for name in options.layouts:
+        lay = loadLayout(name)
+        startTime = time.time()
+        table = layout.MazeDistances(lay.walls)
+        build = time.time() - startTime
+        table.save(layout.MazeDistances.cachePath(lay.layoutText))
+        startTime = time.time()
+        mapped = layout.MazeDistances.load(lay.walls, lay.layoutText)
+        load = time.time() - startTime
+        random.seed(options.seed)
+        pairs = [(random.choice(table.cells), random.choice(table.cells)) for i in range(options.count)]
+        timings = []
+        for distances in [table, mapped]:
+            startTime = time.time()
+            for a, b in pairs: distances.distance(a, b)
+            timings.append((time.time() - startTime) * 1e6 / len(pairs))
+        searches = pairs[:max(1, len(pairs) / 100)]
+        startTime = time.time()
+        for a, b in searches: bfsDistance(lay.walls, a, b)
+        bfs = (time.time() - startTime) * 1e6 / len(searches)
+        print '%-16s %5d cells  build %7.1fms  map %6.2fms  %7.1fKB  lookup %5.2fus (mapped %5.2fus)  bfs %8.1fus' % \
+            (name, table.size, build * 1000, load * 1000, table.nbytes() / 1024.0, timings[0], timings[1], bfs)
+        mapped.close()
+
+def setVisibility(walls):
+    """
+    The sets of visible positions Layout.initializeVisibilityMatrix used to
+    build, with its ray stepping fixed, kept for the 'visibility' benchmark.
+    """
+    vecs = [(0, 0.5), (0, -0.5), (0.5, 0), (-0.5, 0)]
+    dirs = [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST]
+    vis = {}
+    for x in range(walls.width):
+        for y in range(walls.height):
+            if walls[x][y]: continue
+            for (dx, dy), direction in zip(vecs, dirs):
+                seen = vis[(x, y, direction)] = set()
+                nextx, nexty = x + dx, y + dy
+                while (nextx + nexty) != int(nextx) + int(nexty) or not walls[int(nextx)][int(nexty)]:
+                    seen.add((nextx, nexty))
+                    nextx, nexty = nextx + dx, nexty + dy
+    return vis
+
+def benchmarkVisibility(options):
+    """
+    Reports the time to compute the sight lines of each layout as sets and
+    as bitsets, the time to load the bitsets from the disk cache, their
+    size there, and the cost of an isVisibleFrom query.
+    """
+    import marshal, os
+    for name in options.layouts:
+        lay = loadLayout(name)
+        startTime = time.time()
+        setVisibility(lay.walls)
+        sets = time.time() - startTime
+        startTime = time.time()
+        layout.Visibility(lay.walls)
+        build = time.time() - startTime
+        layout.Visibility.load(lay.walls)
+        startTime = time.time()
+        visibility = layout.Visibility.load(lay.walls)
+        load = time.time() - startTime
+        size = len(marshal.dumps(visibility.sightLines))
+        random.seed(options.seed)
+        cells = lay.walls.asList(False)
+        directions = [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST]
+        queries = [(random.choice(cells), random.choice(cells), random.choice(directions)) for i in range(options.count)]
+        startTime = time.time()
+        for ghost, pacman, direction in queries: visibility.isVisibleFrom(ghost, pacman, direction)
+        query = (time.time() - startTime) * 1e6 / len(queries)
+        print '%-16s sets %8.1fms  bitsets %6.2fms  cached %5.2fms  %6.1fKB  query %5.2fus' % \
+            (name, sets * 1000, build * 1000, load * 1000, size / 1024.0, query)
+
+def benchmarkLayouts(options):
+    """
+    Reports the time to load each layout by parsing its text, as getLayout
+    used to, and through the LayoutRegistry and its compiled .layc file.
+    """
+    registry = layout.LayoutRegistry()
+    startTime = time.time()
+    registry.refresh()
+    print 'index %d layouts %.2fms' % (len(registry.index), (time.time() - startTime) * 1000)
+    count = max(1, options.count / 100)
+    for name in options.layouts:
+        path = registry.find(name)
+        registry.loadFile(path)
+        startTime = time.time()
+        for i in range(count): layout.tryToLoad(path)
+        parsed = (time.time() - startTime) * 1e6 / count
+        startTime = time.time()
+        for i in range(count): registry.load(name)
+        compiled = (time.time() - startTime) * 1e6 / count
+        print '%-16s parsed %8.1fus  compiled %7.1fus  %5.1fx' % (name, parsed, compiled, parsed / compiled)
+
+def benchmarkCodec(options):
+    """
+    Compares codec.encode/decode with cPickle on states from random play,
+    for the bytes per state and the time to write and read one.  Every
+    state, and one with an agent taken off the board, must decode to an
+    equal state with the same hash.
+    """
+    import codec, cPickle
+    for name in options.layouts:
+        random.seed(options.seed)
+        state = initialState(loadLayout(name), options.numGhosts)
+        states = []
+        for step in range(200):
+            if state.isWin() or state.isLose(): break
+            agentIndex = step % state.getNumAgents()
+            state = state.generateSuccessor(agentIndex, random.choice(state.getLegalActions(agentIndex)))
+            states.append(state)
+        offBoard = state.deepCopy()
+        offBoard.data.getAgentStateForUpdate(offBoard.getNumAgents() - 1).configuration = None
+        for s in states + [offBoard]:
+            decoded = codec.decode(codec.encode(s))
+            if not decoded == s or hash(decoded) != hash(s):
+                raise Exception('codec does not round-trip a state of ' + name)
+        count = max(1, options.count / len(states) / 10)
+        for label, dumps, loads in [('cPickle', lambda s: cPickle.dumps(s, cPickle.HIGHEST_PROTOCOL), cPickle.loads),
+                                    ('codec', codec.encode, codec.decode)]:
+            startTime = time.time()
+            for i in range(count): encoded = [dumps(s) for s in states]
+            write = (time.time() - startTime) * 1e6 / (count * len(states))
+            startTime = time.time()
+            for i in range(count): [loads(e) for e in encoded]
+            read = (time.time() - startTime) * 1e6 / (count * len(states))
+            size = sum([len(e) for e in encoded]) / float(len(states))
+            print '%-16s %-8s %7.1f bytes  encode %6.1fus  decode %6.1fus' % (name, label, size, write, read)
+
+def benchmarkRecords(options):
+    """
+    Records a random game of at least 1000 moves on each layout and reports
+    the file size, against the pickle of the layout and move history that
+    recorded games used to be, and the time to seek to a random move, against
+    replaying from the start.
+    """
+    import cPickle, os, tempfile
+    import pacman, textDisplay
+    from pacmanAgents import RandomAgent
+    from ghostAgents import RandomGhost
+    from gameRecord import RecordWriter, GameRecord
+    random.seed(options.seed)
+    for name in options.layouts:
+        lay = loadLayout(name)
+        path = tempfile.mktemp()
+        try:
+            numMoves = 0
+            while numMoves < 1000:
+                rules = pacman.ClassicGameRules()
+                game = rules.newGame(lay, RandomAgent(), [RandomGhost(i + 1) for i in range(options.numGhosts)], textDisplay.NullGraphics(), True)
+                game.recorder = RecordWriter(open(path, 'wb'), game.state)
+                game.run()
+                game.recorder.close()
+                numMoves = len(game.moveHistory)
+            size = os.path.getsize(path)
+            legacy = len(cPickle.dumps({'layout': lay, 'actions': game.moveHistory}))
+            record = GameRecord.load(path)
+            targets = [random.randint(0, record.numMoves) for i in range(max(1, options.count / 1000))]
+            startTime = time.time()
+            for n in targets: record.stateAt(n)
+            seek = (time.time() - startTime) * 1000 / len(targets)
+            startTime = time.time()
+            for n in targets:
+                state = record.stateAt(0)
+                for agentIndex, action in game.moveHistory[:n]:
+                    state = state.generateSuccessor(agentIndex, action)
+            replay = (time.time() - startTime) * 1000 / len(targets)
+            print '%-16s %5d moves  %6d bytes (%.2f/move, pickle %6d)  seek %6.2fms  replay %7.2fms' % \
+                (name, numMoves, size, size / float(numMoves), legacy, seek, replay)
+        finally:
+            if os.path.exists(path): os.remove(path)
+
+def benchmarkTrajectories(options):
+    """
+    Compares writing the Pacman actions of many random games as one text
+    file per game, as Game.fileName used to, with a TrajectorySink, and
+    reports the file sizes and the time to stream the sink's file back.
+    """
+    import os, shutil, tempfile
+    from trajectories import TrajectorySink, TrajectoryReader
+    random.seed(options.seed)
+    actions = [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST]
+    games = [[random.choice(actions) for i in range(random.randint(50, 500))] for j in range(max(1, options.count / 50))]
+    directory = tempfile.mkdtemp()
+    try:
+        startTime = time.time()
+        for i, history in enumerate(games):
+            f = open(os.path.join(directory, 'game-%d' % i), 'w')
+            for action in history: f.write(action + '\n')
+            f.close()
+        elapsed = time.time() - startTime
+        size = sum([os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory)])
+        print '%-12s %6d games  write %7.1fms  %9d bytes' % ('text files', len(games), elapsed * 1000, size)
+        for label, compress in [('sink', False), ('sink+zlib', True)]:
+            path = os.path.join(directory, label)
+            startTime = time.time()
+            sink = TrajectorySink(path, compress)
+            for history in games: sink.add(options.seed, 'benchmark', history, 0, False)
+            sink.close()
+            elapsed = time.time() - startTime
+            startTime = time.time()
+            for game in TrajectoryReader(path): pass
+            read = time.time() - startTime
+            print '%-12s %6d games  write %7.1fms  %9d bytes  read %7.1fms' % (label, len(games), elapsed * 1000, os.path.getsize(path), read * 1000)
+    finally:
+        shutil.rmtree(directory)
+
+class CountingWriter:
+    """
+    A file wrapper that counts the bytes written through it.
+    """
+    def __init__(self, out):
+        self.out = out
+        self.count = 0
+
+    def write(self, text):
+        self.count += len(text)
+        self.out.write(text)
+
+    def flush(self):
+        self.out.flush()
+
+def benchmarkRender(options):
+    """
+    Reports the time and output per frame of the text display on states from
+    random play (by default on originalClassic and bigMaze): printing the state, as PacmanGraphics used to, and the
+    TextRenderer drawing full frames and drawing only the changes.
+    """
+    import os, textDisplay
+    from pacmanAgents import RandomAgent
+    random.seed(options.seed)
+    agent = RandomAgent()
+    for name in options.layouts:
+        state = initialState(loadLayout(name), options.numGhosts)
+        states = []
+        while len(states) < 500 and not (state.isWin() or state.isLose()):
+            for agentIndex in range(state.getNumAgents()):
+                if state.isWin() or state.isLose(): break
+                if agentIndex == 0: action = agent.getAction(state)
+                else: action = random.choice(state.getLegalActions(agentIndex))
+                state = state.generateSuccessor(agentIndex, action)
+            states.append(state.data)
+        out = CountingWriter(open(os.devnull, 'w'))
+        timings = []
+        startTime = time.time()
+        for data in states: print >>out, data
+        out.flush()
+        timings.append(('print', time.time() - startTime, out.count))
+        interval, textDisplay.FRAME_INTERVAL = textDisplay.FRAME_INTERVAL, 0
+        try:
+            for label, incremental in [('full', False), ('changes', True)]:
+                out.count = 0
+                renderer = textDisplay.TextRenderer(out, incremental)
+                startTime = time.time()
+                for data in states: renderer.draw(data)
+                renderer.flush(True)
+                timings.append((label, time.time() - startTime, out.count))
+        finally:
+            textDisplay.FRAME_INTERVAL = interval
+            out.out.close()
+        print '%-16s %4d frames  ' % (name, len(states)) + '  '.join(['%s %6.1fus %5d bytes' % (label, elapsed * 1e6 / len(states), size / len(states)) for label, elapsed, size in timings])
+
+BENCHMARKS = {
+    'successors': benchmarkSuccessors,
+    'grids': benchmarkGrids,
+    'hashing': benchmarkHashing,
+    'heuristic': benchmarkHeuristic,
+    'expansion': benchmarkExpansion,
+    'batch': benchmarkBatch,
+    'observation': benchmarkObservation,
+    'memory': benchmarkMemory,
+    'queue': benchmarkQueue,
+    'search': benchmarkSearch,
+    'deadline': benchmarkDeadline,
+    'mcts': benchmarkMCTS,
+    'distances': benchmarkDistances,
+    'visibility': benchmarkVisibility,
+    'layouts': benchmarkLayouts,
+    'codec': benchmarkCodec,
+    'records': benchmarkRecords,
+    'trajectories': benchmarkTrajectories,
+    'render': benchmarkRender,
+}
+
+# Layouts a benchmark runs on when none are given with -l
+DEFAULT_LAYOUTS = {
+    'heuristic': ['mediumSearch', 'bigSearch', 'bigSafeSearch'],
+    'memory': ['bigSearch'],
+    'mcts': ['mediumClassic'],
+    'distances': ['bigMaze', 'contoursMaze', 'originalClassic'],
+    'render': ['originalClassic', 'bigMaze'],
+}
+
+def readCommand(argv):
+    from optparse import OptionParser
+    usageStr = """
+    USAGE:      python benchmarks.py <benchmark> <options>
+    BENCHMARKS: %s
+    """ % ', '.join(sorted(BENCHMARKS.keys()))
+    parser = OptionParser(usageStr)
+    parser.add_option('-l', '--layout', dest='layouts', action='append',
+                      help='a LAYOUT_FILE to benchmark on (may be repeated)', metavar='LAYOUT_FILE')
+    parser.add_option('-n', '--count', dest='count', type='int',
+                      help='the amount of work per measurement [Default: %default]', default=50000)
+    parser.add_option('-k', '--numghosts', type='int', dest='numGhosts',
+                      help='The maximum number of ghosts to use [Default: %default]', default=4)
+    parser.add_option('-s', '--seed', type='int', dest='seed',
+                      help='The random seed [Default: %default]', default=0)
+    options, args = parser.parse_args(argv)
+    if len(args) != 1 or args[0] not in BENCHMARKS:
+        parser.print_help()
+        sys.exit(2)
+    if options.layouts == None: options.layouts = DEFAULT_LAYOUTS.get(args[0], ['mediumClassic', 'originalClassic'])
+    return BENCHMARKS[args[0]], options
+
+if __name__ == '__main__':
+    benchmark, options = readCommand(sys.argv[1:])
+    benchmark(options)
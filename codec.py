@@ -0,0 +1,177 @@
+# codec.py
+# --------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+A compact binary encoding of game states, for sending them between
+processes and storing them.
+
+> data = codec.encode(state)
+> state = codec.decode(data)
+
+An encoded state is a fixed header followed by the food, the capsules and
+one record per agent:
+
+  header    'PS', the format version, the layout's fingerprint, the score,
+            the last score change, the win/lose flags and the agent count
+  food      the food bits of the state's BitGrid, (width * height + 7) / 8
+            bytes
+  capsules  one bit per capsule of the layout, set if it is still there
+  agents    position and start position at half-cell resolution, direction
+            codes, flags, scared timer and carried/returned food
+
+The layout itself is not stored, only Layout.getFingerprint().  decode
+finds the layout among those encode has seen in this process or registered
+with registerLayout, and otherwise among the files of the layout registry.
+What a state records about the move that produced it (_agentMoved,
+_foodEaten, ...) is not encoded, and the decoded state belongs to a new
+GameContext unless decode is given one.
+"""
+
+from game import GameStateData
+from game import GameContext
+from game import AgentState
+from game import Configuration
+from game import Directions
+from game import BitGrid
+import layout
+import binascii
+import os
+import struct
+
+VERSION = 1
+HEADER = struct.Struct('=2sBQiiBB')
+AGENT = struct.Struct('=hhBBhhBHHH')
+DIRECTIONS = [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST, Directions.STOP]
+DIRECTION_CODES = dict([(direction, code) for code, direction in enumerate(DIRECTIONS)])
+
+WIN, LOSE = 1, 2
+PACMAN, EATEN, NO_CONFIGURATION = 1, 2, 4
+
+LAYOUTS = {}
+
+def registerLayout(lay):
+    """
+    Lets decode find a read-only layout by its fingerprint.
+    """
+    if not lay.walls.frozen:
+        raise Exception('Only read-only layouts can be encoded; this one is a clone()')
+    LAYOUTS[lay.getFingerprint()] = lay
+
+def findLayout(fingerprint):
+    if fingerprint not in LAYOUTS:
+        registry = layout.getRegistry()
+        path = registry.findFingerprint(fingerprint)
+        if path is None:
+            raise Exception('No layout with the fingerprint %016x was registered or is in the layout directories' % fingerprint)
+        lay = registry.loadFile(path)
+        registerLayout(layout.sharedLayout(lay.layoutText, os.path.basename(path)[:-len('.lay')]))
+    return LAYOUTS[fingerprint]
+
+def bitsToBytes(bits, size):
+    return binascii.unhexlify('%0*x' % (2 * size, bits))
+
+def bytesToBits(data):
+    if not data: return 0
+    return int(binascii.hexlify(data), 16)
+
+def encodeConfiguration(configuration):
+    if configuration is None: return 0, 0, 0
+    x, y = configuration.pos
+    return int(x * 2), int(y * 2), DIRECTION_CODES[configuration.direction]
+
+def decodeConfiguration(x, y, code):
+    # Grid points come back as ints; scared ghosts may sit on a half point
+    return Configuration.intern((x % 2 and x / 2.0 or x / 2, y % 2 and y / 2.0 or y / 2), DIRECTIONS[code])
+
+def encode(state):
+    """
+    Returns the bytes of a GameState or GameStateData.
+    """
+    data = getattr(state, 'data', state)
+    lay = data.layout
+    if lay.getFingerprint() not in LAYOUTS: registerLayout(lay)
+    if data.score != int(data.score):
+        raise Exception('Only whole scores can be encoded, not %r' % data.score)
+    flags = (data._win and WIN) | (data._lose and LOSE)
+    parts = [HEADER.pack('PS', VERSION, lay.getFingerprint(), int(data.score), int(data.scoreChange), flags, len(data.agentStates))]
+    parts.append(bitsToBytes(data.food.bits, (lay.width * lay.height + 7) / 8))
+    capsules = 0
+    for i, position in enumerate(lay.capsules):
+        if position in data.capsules: capsules |= 1 << i
+    if len(data.capsules) != bin(capsules).count('1'):
+        raise Exception('The state has capsules its layout does not')
+    parts.append(bitsToBytes(capsules, (len(lay.capsules) + 7) / 8))
+    for agentState, eaten in zip(data.agentStates, data._eaten):
+        flags = (agentState.isPacman and PACMAN) | (eaten and EATEN) | (agentState.configuration is None and NO_CONFIGURATION)
+        x, y, direction = encodeConfiguration(agentState.configuration)
+        startX, startY, startDirection = encodeConfiguration(agentState.start)
+        parts.append(AGENT.pack(x, y, direction, flags, startX, startY, startDirection,
+                                agentState.scaredTimer, agentState.numCarrying, agentState.numReturned))
+    return ''.join(parts)
+
+def decodeData(encoded, context=None):
+    """
+    Returns the GameStateData encoded in encoded.
+    """
+    magic, version, fingerprint, score, scoreChange, flags, numAgents = HEADER.unpack_from(encoded)
+    if magic != 'PS': raise Exception('This is not an encoded game state')
+    if version != VERSION: raise Exception('Cannot decode version %d of the state format' % version)
+    lay = findLayout(fingerprint)
+    if context is None: context = GameContext()
+    data = GameStateData()
+    data.context = context
+    data.layout = lay
+    data.score = score
+    data.scoreChange = scoreChange
+    data._win = flags & WIN != 0
+    data._lose = flags & LOSE != 0
+    offset = HEADER.size
+    size = (lay.width * lay.height + 7) / 8
+    data.food = BitGrid(lay.width, lay.height)
+    data.food.bits = bytesToBits(encoded[offset:offset + size])
+    data.numFood = data.food.count()
+    data._foodPositions = None
+    data._foodPositionsEaten = ()
+    offset += size
+    size = (len(lay.capsules) + 7) / 8
+    capsules = bytesToBits(encoded[offset:offset + size])
+    data.capsules = [position for i, position in enumerate(lay.capsules) if capsules >> i & 1]
+    offset += size
+    data.agentStates = []
+    data._eaten = []
+    for i in range(numAgents):
+        x, y, direction, flags, startX, startY, startDirection, scaredTimer, numCarrying, numReturned = AGENT.unpack_from(encoded, offset)
+        offset += AGENT.size
+        agentState = AgentState(decodeConfiguration(startX, startY, startDirection), flags & PACMAN != 0)
+        if flags & NO_CONFIGURATION:
+            agentState.configuration = None
+        else:
+            agentState.configuration = decodeConfiguration(x, y, direction)
+        agentState.scaredTimer = scaredTimer
+        agentState.numCarrying = numCarrying
+        agentState.numReturned = numReturned
+        data.agentStates.append(agentState)
+        data._eaten.append(flags & EATEN != 0)
+    data._ownAll()
+    data._computeZobristHash()
+    return data
+
+def decode(encoded, context=None):
+    """
+    Returns the GameState encoded in encoded.
+    """
+    from pacman import GameState
+    state = GameState()
+    state.data = decodeData(encoded, context)
+    return state
@@ -24,6 +24,8 @@ from util import *
 import time, os
 import traceback
 import sys
+import random
+import threading
 
 #######################
 # Parts worth reading #
@@ -35,7 +37,13 @@ class Agent:
     following methods which will be called if they exist:
 
     def registerInitialState(self, state): # inspects the starting state
+    def setTimeLeft(self, seconds): # told before each getAction how long it may take
+
+    The states an agent is handed are read-only views of the game's own state.
+    An agent that wants private copies it may modify sets deepCopyObservations.
     """
+    deepCopyObservations = False
+
     def __init__(self, index=0):
         self.index = index
 
@@ -67,18 +75,44 @@ class Directions:
                WEST: EAST,
                STOP: STOP}
 
-class Configuration:
+class Configuration(object):
     """
     A Configuration holds the (x,y) coordinate of a character, along with its
     traveling direction.
 
     The convention for positions, like a graph, is that (0,0) is the lower left corner, x increases
     horizontally and y increases vertically.  Therefore, north is the direction of increasing y, or (0,1).
+
+    Configurations are never modified once made, so the engine shares one
+    instance per (position, direction) through Configuration.intern.
     """
+    __slots__ = ('pos', 'direction')
+    _interned = {}
 
     def __init__(self, pos, direction):
-        self.pos = pos
-        self.direction = direction
+        object.__setattr__(self, 'pos', pos)
+        object.__setattr__(self, 'direction', direction)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Configurations are immutable; cannot set %s' % name)
+
+    def __delattr__(self, name):
+        raise AttributeError('Configurations are immutable; cannot delete %s' % name)
+
+    def intern(pos, direction):
+        """
+        Returns the shared Configuration for pos and direction.
+        """
+        key = (pos, direction)
+        try:
+            return Configuration._interned[key]
+        except KeyError:
+            configuration = Configuration._interned[key] = Configuration(pos, direction)
+            return configuration
+    intern = staticmethod(intern)
+
+    def __reduce__(self):
+        return (Configuration, (self.pos, self.direction))
 
     def getPosition(self):
         return (self.pos)
@@ -91,9 +125,13 @@ class Configuration:
         return x == int(x) and y == int(y)
 
     def __eq__(self, other):
+        if self is other: return True
         if other == None: return False
         return (self.pos == other.pos and self.direction == other.direction)
 
+    def __ne__(self, other):
+        return not self == other
+
     def __hash__(self):
         x = hash(self.pos)
         y = hash(self.direction)
@@ -112,15 +150,19 @@ class Configuration:
         """
         x, y= self.pos
         dx, dy = vector
-        direction = Actions.vectorToDirection(vector)
+        try:
+            direction = Actions._vectorDirections[vector]
+        except KeyError:
+            direction = Actions.vectorToDirection(vector)
         if direction == Directions.STOP:
             direction = self.direction # There is no stop direction
-        return Configuration((x + dx, y+dy), direction)
+        return Configuration.intern((x + dx, y+dy), direction)
 
-class AgentState:
+class AgentState(object):
     """
     AgentStates hold the state of an agent (configuration, speed, scared, etc).
     """
+    __slots__ = ('start', 'configuration', 'isPacman', 'scaredTimer', 'numCarrying', 'numReturned')
 
     def __init__( self, startConfiguration, isPacman ):
         self.start = startConfiguration
@@ -130,6 +172,12 @@ class AgentState:
         self.numCarrying = 0
         self.numReturned = 0
 
+    def __getstate__( self ):
+        return (self.start, self.configuration, self.isPacman, self.scaredTimer, self.numCarrying, self.numReturned)
+
+    def __setstate__( self, state ):
+        self.start, self.configuration, self.isPacman, self.scaredTimer, self.numCarrying, self.numReturned = state
+
     def __str__( self ):
         if self.isPacman:
             return "Pacman: " + str( self.configuration )
@@ -141,6 +189,9 @@ class AgentState:
             return False
         return self.configuration == other.configuration and self.scaredTimer == other.scaredTimer
 
+    def __ne__( self, other ):
+        return not self == other
+
     def __hash__(self):
         return hash(hash(self.configuration) + 13 * hash(self.scaredTimer))
 
@@ -159,6 +210,26 @@ class AgentState:
     def getDirection(self):
         return self.configuration.getDirection()
 
+class ReadOnlyAgentState(AgentState):
+    """
+    A snapshot of an AgentState that raises on assignment, handed out by
+    ReadOnlyStateData.  copy() returns an ordinary, writable AgentState.
+    """
+    __slots__ = ()
+
+    def __init__( self, agentState ):
+        for name in AgentState.__slots__:
+            object.__setattr__( self, name, getattr( agentState, name ) )
+
+    def __setattr__( self, name, value ):
+        raise AttributeError( 'Observations are read-only; cannot set %s' % name )
+
+    def __delattr__( self, name ):
+        raise AttributeError( 'Observations are read-only; cannot delete %s' % name )
+
+    def __reduce__( self ):
+        return (ReadOnlyAgentState, (self.copy(),))
+
 class Grid:
     """
     A 2-dimensional array of objects backed by a list of lists.  Data is accessed
@@ -232,17 +303,14 @@ class Grid:
 
         (width, height, bitPackedInts...)
         """
+        size = self.CELLS_PER_INT
+        cells = ''.join([''.join([cell and '1' or '0' for cell in column]) for column in self.data])
         bits = [self.width, self.height]
-        currentInt = 0
-        for i in range(self.height * self.width):
-            bit = self.CELLS_PER_INT - (i % self.CELLS_PER_INT) - 1
-            x, y = self._cellIndexToPosition(i)
-            if self[x][y]:
-                currentInt += 2 ** bit
-            if (i + 1) % self.CELLS_PER_INT == 0:
-                bits.append(currentInt)
-                currentInt = 0
-        bits.append(currentInt)
+        # The first cell of each int is its most significant bit
+        for start in range(0, len(cells), size):
+            bits.append(int(cells[start:start + size].ljust(size, '0'), 2))
+        if len(cells) % size == 0:
+            bits.append(0)
         return tuple(bits)
 
     def _cellIndexToPosition(self, index):
@@ -254,31 +322,189 @@ class Grid:
         """
         Fills in data from a bit-level representation
         """
-        cell = 0
+        cells = []
         for packed in bits:
-            for bit in self._unpackInt(packed, self.CELLS_PER_INT):
-                if cell == self.width * self.height: break
-                x, y = self._cellIndexToPosition(cell)
-                self[x][y] = bit
-                cell += 1
+            cells.extend(self._unpackInt(packed, self.CELLS_PER_INT))
+        height = self.height
+        for x in range(self.width):
+            self.data[x] = cells[x * height:(x + 1) * height]
 
     def _unpackInt(self, packed, size):
-        bools = []
         if packed < 0: raise ValueError, "must be a positive integer"
-        for i in range(size):
-            n = 2 ** (self.CELLS_PER_INT - i - 1)
-            if packed >= n:
-                bools.append(True)
-                packed -= n
-            else:
-                bools.append(False)
-        return bools
+        return [bit == '1' for bit in format(packed, '0%db' % size)[-size:]]
+
+class BitGrid:
+    """
+    A boolean Grid stored as the bits of a single integer, cell (x,y) being
+    bit x * height + y.  It keeps the grid[x][y] interface of Grid, but since
+    the bits are an immutable int, copy() is O(1), count() is a popcount and
+    the hash only looks at one number.
+
+    freeze() makes a grid read-only, so that it can be shared by everything
+    that reads it; copy() of a frozen grid is writable again.
+    """
+    def __init__(self, width, height, initialValue=False, bitRepresentation=None):
+        if initialValue not in [False, True]: raise Exception('Grids can only contain booleans')
+        self.CELLS_PER_INT = 30
+
+        self.width = width
+        self.height = height
+        self._mask = (1 << (width * height)) - 1
+        self._columns = {}
+        self.frozen = False
+        if initialValue:
+            self.bits = self._mask
+        else:
+            self.bits = 0
+        if bitRepresentation:
+            self._unpackBits(bitRepresentation)
+
+    def __getitem__(self, x):
+        try:
+            return self._columns[x]
+        except KeyError:
+            column = self._columns[x] = _BitGridColumn(self, x)
+            return column
+
+    def __setitem__(self, x, column):
+        for y in range(self.height):
+            self.set(x, y, column[y])
+
+    def __iter__(self):
+        for x in range(self.width):
+            yield _BitGridColumn(self, x)
+
+    def __len__(self):
+        return self.width
+
+    def freeze(self):
+        self.frozen = True
+        return self
+
+    def __getstate__(self):
+        # The column views are a cache and are rebuilt on demand
+        state = self.__dict__.copy()
+        state['_columns'] = {}
+        return state
+
+    def get(self, x, y):
+        return (self.bits >> (x * self.height + y)) & 1 == 1
+
+    def set(self, x, y, value):
+        if self.frozen: raise Exception('This grid is frozen; write to a copy() of it')
+        bit = 1 << (x * self.height + y)
+        if value:
+            self.bits |= bit
+        else:
+            self.bits &= ~bit
+
+    def __str__(self):
+        out = [[str(self.get(x, y))[0] for x in range(self.width)] for y in range(self.height)]
+        out.reverse()
+        return '\n'.join([''.join(x) for x in out])
+
+    def __eq__(self, other):
+        if other == None: return False
+        if isinstance(other, BitGrid):
+            return self.bits == other.bits and self.height == other.height
+        return self.packBits() == other.packBits()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.bits)
+
+    def copy(self):
+        g = BitGrid(self.width, self.height)
+        g.bits = self.bits
+        return g
+
+    def deepCopy(self):
+        return self.copy()
+
+    def shallowCopy(self):
+        return self.copy()
+
+    def count(self, item =True ):
+        trueCount = bin(self.bits).count('1')
+        if item: return trueCount
+        return self.width * self.height - trueCount
+
+    def asList(self, key = True):
+        bits = self.bits
+        if not key: bits = ~bits & self._mask
+        height = self.height
+        list = []
+        while bits:
+            lowest = bits & -bits
+            index = lowest.bit_length() - 1
+            list.append( (index // height, index % height) )
+            bits ^= lowest
+        return list
+
+    def packBits(self):
+        """
+        Returns the same (width, height, bitPackedInts...) tuple as
+        Grid.packBits, built a whole int at a time.
+        """
+        size = self.CELLS_PER_INT
+        chunkMask = (1 << size) - 1
+        numCells = self.width * self.height
+        bits = [self.width, self.height]
+        for start in range(0, numCells, size):
+            chunk = (self.bits >> start) & chunkMask
+            # Grid stores the first cell of each int in its most significant bit
+            bits.append(int(format(chunk, '0%db' % size)[::-1], 2))
+        if numCells % size == 0:
+            bits.append(0)
+        return tuple(bits)
+
+    def _unpackBits(self, packed):
+        """
+        Fills in data from a Grid.packBits representation
+        """
+        size = self.CELLS_PER_INT
+        bits = 0
+        for i, chunk in enumerate(packed):
+            if chunk < 0: raise ValueError, "must be a positive integer"
+            bits |= int(format(chunk, '0%db' % size)[::-1], 2) << (i * size)
+        self.bits = bits & self._mask
+
+class _BitGridColumn(object):
+    """
+    The grid[x] view of a BitGrid; reads and writes go straight to the grid's bits.
+    """
+    __slots__ = ('grid', 'offset')
+
+    def __init__(self, grid, x):
+        self.grid = grid
+        self.offset = x * grid.height
+
+    def __getitem__(self, y):
+        return (self.grid.bits >> (self.offset + y)) & 1 == 1
+
+    def __setitem__(self, y, value):
+        if self.grid.frozen: raise Exception('This grid is frozen; write to a copy() of it')
+        bit = 1 << (self.offset + y)
+        if value:
+            self.grid.bits |= bit
+        else:
+            self.grid.bits &= ~bit
+
+    def __iter__(self):
+        bits = self.grid.bits >> self.offset
+        for y in range(self.grid.height):
+            yield (bits >> y) & 1 == 1
+
+    def __len__(self):
+        return self.grid.height
 
 def reconstituteGrid(bitRep):
     if type(bitRep) is not type((1,2)):
         return bitRep
     width, height = bitRep[:2]
-    return Grid(width, height, bitRepresentation= bitRep[2:])
+    return BitGrid(width, height, bitRepresentation= bitRep[2:])
 
 ####################################
 # Parts you shouldn't have to read #
@@ -297,6 +523,9 @@ class Actions:
 
     _directionsAsList = _directions.items()
 
+    _vectorDirections = dict([((dx * speed, dy * speed), direction)
+                              for direction, (dx, dy) in _directionsAsList for speed in [1, 0.5]])
+
     TOLERANCE = .001
 
     def reverseDirection(action):
@@ -338,6 +567,15 @@ class Actions:
         if (abs(x - x_int) + abs(y - y_int)  > Actions.TOLERANCE):
             return [config.getDirection()]
 
+        if isinstance(walls, BitGrid):
+            # Test the neighbouring wall bits directly instead of going through grid[x][y]
+            bits, height = walls.bits, walls.height
+            base = x_int * height + y_int
+            for dir, vec in Actions._directionsAsList:
+                dx, dy = vec
+                if not (bits >> (base + dx * height + dy)) & 1: possible.append(dir)
+            return possible
+
         for dir, vec in Actions._directionsAsList:
             dx, dy = vec
             next_y = y_int + dy
@@ -368,6 +606,148 @@ class Actions:
         return (x + dx, y + dy)
     getSuccessor = staticmethod(getSuccessor)
 
+class MoveTable:
+    """
+    The legal moves of every open cell of a layout, compiled once from its
+    walls.  Layout.getMoveTable shares one table between every copy of a
+    layout, so all the games of a run look moves up here instead of
+    re-deriving them from the walls grid.
+
+    Positions between grid points (scared ghosts) are not in the table;
+    as in Actions.getPossibleActions, agents there must continue straight.
+    """
+    def __init__(self, walls):
+        self.actions = {}
+        self.pacmanActions = {}
+        self.ghostActions = {}
+        self.successors = {}
+        for x in range(walls.width):
+            for y in range(walls.height):
+                if walls[x][y]: continue
+                pos = (x, y)
+                actions = []
+                for dir, vec in Actions._directionsAsList:
+                    dx, dy = vec
+                    if walls[x + dx][y + dy]: continue
+                    actions.append(dir)
+                    if dir != Directions.STOP:
+                        self.successors[(pos, dir)] = Configuration.intern((x + dx, y + dy), dir)
+                self.actions[pos] = tuple(actions)
+                moves = tuple([a for a in actions if a != Directions.STOP])
+                self.pacmanActions[pos] = moves
+                for direction in Actions._directions.keys():
+                    reverse = Actions.reverseDirection(direction)
+                    if reverse in moves and len(moves) > 1:
+                        self.ghostActions[(pos, direction)] = tuple([a for a in moves if a != reverse])
+                    else:
+                        self.ghostActions[(pos, direction)] = moves
+
+    def getPossibleActions(self, config):
+        """
+        The actions Actions.getPossibleActions would allow, as a tuple.
+        """
+        try:
+            return self.actions[config.pos]
+        except KeyError:
+            return (config.direction,)
+
+    def getPacmanActions(self, config):
+        """
+        The possible actions other than STOP.
+        """
+        try:
+            return self.pacmanActions[config.pos]
+        except KeyError:
+            return (config.direction,)
+
+    def getGhostActions(self, config):
+        """
+        The possible actions other than STOP and, unless it is the only way
+        out, reversing direction.
+        """
+        try:
+            return self.ghostActions[(config.pos, config.direction)]
+        except KeyError:
+            return (config.direction,)
+
+    def getSuccessor(self, config, action):
+        """
+        The Configuration reached by moving one full step with action.
+        """
+        if action == Directions.STOP: return config
+        try:
+            return self.successors[(config.pos, action)]
+        except KeyError:
+            return config.generateSuccessor(Actions.directionToVector(action))
+
+class Zobrist:
+    """
+    Random 64-bit keys for the parts of a game state.  The hash of a
+    GameStateData is the xor of the keys of its agent configurations, scared
+    timers, food cells and capsules, so a move only has to xor out the keys of
+    what it changed and xor in the new ones.
+
+    Keys are drawn lazily from a private generator, so hashing never touches
+    the game's random stream.  A key is drawn under a lock, so threads
+    sharing a GameContext never give one feature two different keys.
+    """
+    _random = random.Random(0x5eed)
+    _keys = {}
+    _lock = threading.Lock()
+
+    def key(feature):
+        try:
+            return Zobrist._keys[feature]
+        except KeyError:
+            Zobrist._lock.acquire()
+            try:
+                if feature not in Zobrist._keys:
+                    Zobrist._keys[feature] = Zobrist._random.getrandbits(64)
+                return Zobrist._keys[feature]
+            finally:
+                Zobrist._lock.release()
+    key = staticmethod(key)
+
+    def agentKey(agentIndex, agentState):
+        conf = agentState.configuration
+        if conf is None:
+            # An agent off the board, such as one in a state decoded by codec
+            position = Zobrist.key((agentIndex, None))
+        else:
+            position = Zobrist.key((agentIndex, conf.pos, conf.direction))
+        return position ^ Zobrist.key((agentIndex, agentState.scaredTimer))
+    agentKey = staticmethod(agentKey)
+
+    def foodKey(position):
+        return Zobrist.key(('food', position))
+    foodKey = staticmethod(foodKey)
+
+    def capsuleKey(position):
+        return Zobrist.key(('capsule', position))
+    capsuleKey = staticmethod(capsuleKey)
+
+    _foodHashes = {}
+
+    def foodHash(food, reference):
+        """
+        The xor of the keys of the food in food.  When food differs from the
+        reference grid (the layout's food) in fewer cells than it holds, the
+        cached hash of the reference is patched instead.
+        """
+        difference = BitGrid(food.width, food.height)
+        difference.bits = food.bits ^ reference.bits
+        if difference.count() >= food.count():
+            cells, h = food.asList(), 0
+        else:
+            key = (reference.width, reference.height, reference.bits)
+            if key not in Zobrist._foodHashes:
+                Zobrist._foodHashes[key] = Zobrist.foodHash(reference, BitGrid(food.width, food.height))
+            cells, h = difference.asList(), Zobrist._foodHashes[key]
+        for position in cells:
+            h ^= Zobrist.foodKey(position)
+        return h
+    foodHash = staticmethod(foodHash)
+
 class GameStateData:
     """
 
@@ -377,12 +757,26 @@ class GameStateData:
         Generates a new data packet by copying information from its predecessor.
         """
         if prevState != None:
-            self.food = prevState.food.shallowCopy()
-            self.capsules = prevState.capsules[:]
-            self.agentStates = self.copyAgentStates( prevState.agentStates )
+            # The successor shares the food grid, the capsule list, _eaten and
+            # every AgentState with its predecessor.  Rules that change one of
+            # them must go through the get*ForUpdate methods below, which copy
+            # that one piece the first time it is written.
+            self.food = prevState.food
+            self.capsules = prevState.capsules
+            self.agentStates = prevState.agentStates[:]
             self.layout = prevState.layout
             self._eaten = prevState._eaten
             self.score = prevState.score
+            self.numFood = prevState.numFood
+            self._foodPositions = prevState._foodPositions
+            self._foodPositionsEaten = prevState._foodPositionsEaten
+            self.context = prevState.context
+            self._hash = prevState.getZobristHash()
+        self._ownedAgents = 0
+        self._staleAgents = 0
+        self._ownsFood = False
+        self._ownsCapsules = False
+        self._ownsEaten = False
 
         self._foodEaten = None
         self._foodAdded = None
@@ -395,7 +789,10 @@ class GameStateData:
     def deepCopy( self ):
         state = GameStateData( self )
         state.food = self.food.deepCopy()
-        state.layout = self.layout.deepCopy()
+        state.capsules = self.capsules[:]
+        state.agentStates = self.copyAgentStates( self.agentStates )
+        state._eaten = self._eaten[:]
+        state._ownAll()
         state._agentMoved = self._agentMoved
         state._foodEaten = self._foodEaten
         state._foodAdded = self._foodAdded
@@ -408,12 +805,111 @@ class GameStateData:
             copiedStates.append( agentState.copy() )
         return copiedStates
 
+    def _ownAll( self ):
+        self._ownedAgents = (1 << len(self.agentStates)) - 1
+        self._ownsFood = True
+        self._ownsCapsules = True
+        self._ownsEaten = True
+
+    def getAgentStateForUpdate( self, agentIndex ):
+        """
+        Returns the AgentState of agentIndex, first replacing it with a private
+        copy if it is still shared with the predecessor state.
+
+        The agent's hash key is taken out until the next getZobristHash, which
+        adds back the key of whatever the caller changed it to.
+        """
+        mask = 1 << agentIndex
+        if not self._staleAgents & mask:
+            self._hash ^= Zobrist.agentKey( agentIndex, self.agentStates[agentIndex] )
+            self._staleAgents |= mask
+        if not self._ownedAgents & mask:
+            self.agentStates[agentIndex] = self.agentStates[agentIndex].copy()
+            self._ownedAgents |= mask
+        return self.agentStates[agentIndex]
+
+    def getFoodForUpdate( self ):
+        """
+        Returns a food Grid that may be modified in place.
+        """
+        if not self._ownsFood:
+            self.food = self.food.copy()
+            self._ownsFood = True
+        return self.food
+
+    def getCapsulesForUpdate( self ):
+        """
+        Returns a capsule list that may be modified in place.
+        """
+        if not self._ownsCapsules:
+            self.capsules = self.capsules[:]
+            self._ownsCapsules = True
+        return self.capsules
+
+    def removeFood( self, position ):
+        x, y = position
+        self.getFoodForUpdate()[x][y] = False
+        self.numFood -= 1
+        if self._foodPositions != None:
+            self._foodPositionsEaten = self._foodPositionsEaten + ( position, )
+        self._hash ^= Zobrist.foodKey( position )
+
+    def getFoodPositions( self ):
+        """
+        Returns a frozenset of the (x,y) positions that still hold food.  It is
+        built on first use and shared with successors.  Eating food only notes
+        the position in _foodPositionsEaten; the set drops those positions the
+        next time it is asked for.
+        """
+        if self._foodPositions == None:
+            self._foodPositions = frozenset( self.food.asList() )
+            self._foodPositionsEaten = ()
+        elif self._foodPositionsEaten:
+            self._foodPositions = self._foodPositions.difference( self._foodPositionsEaten )
+            self._foodPositionsEaten = ()
+        return self._foodPositions
+
+    def removeCapsule( self, position ):
+        self.getCapsulesForUpdate().remove( position )
+        self._hash ^= Zobrist.capsuleKey( position )
+
+    def getZobristHash( self ):
+        """
+        Returns the 64-bit Zobrist hash of the agents, food and capsules.
+        """
+        if self._staleAgents:
+            for agentIndex in range( len( self.agentStates ) ):
+                if self._staleAgents & (1 << agentIndex):
+                    self._hash ^= Zobrist.agentKey( agentIndex, self.agentStates[agentIndex] )
+            self._staleAgents = 0
+        return self._hash
+
+    def _computeZobristHash( self ):
+        h = 0
+        for agentIndex, agentState in enumerate( self.agentStates ):
+            h ^= Zobrist.agentKey( agentIndex, agentState )
+        h ^= Zobrist.foodHash( self.food, self.layout.food )
+        for position in self.capsules:
+            h ^= Zobrist.capsuleKey( position )
+        self._hash = h
+        self._staleAgents = 0
+
+    def getEatenForUpdate( self ):
+        """
+        Returns an _eaten list that may be modified in place.
+        """
+        if not self._ownsEaten:
+            self._eaten = self._eaten[:]
+            self._ownsEaten = True
+        return self._eaten
+
     def __eq__( self, other ):
         """
         Allows two states to be compared.
         """
         if other == None: return False
         # TODO Check for type of other
+        if hash(self) != hash(other): return False
         if not self.agentStates == other.agentStates: return False
         if not self.food == other.food: return False
         if not self.capsules == other.capsules: return False
@@ -424,13 +920,7 @@ class GameStateData:
         """
         Allows states to be keys of dictionaries.
         """
-        for i, state in enumerate( self.agentStates ):
-            try:
-                int(hash(state))
-            except TypeError, e:
-                print e
-                #hash(state)
-        return int((hash(tuple(self.agentStates)) + 13*hash(self.food) + 113* hash(tuple(self.capsules)) + 7 * hash(self.score)) % 1048575 )
+        return hash( ( self.getZobristHash(), self.score ) )
 
     def __str__( self ):
         width, height = self.layout.width, self.layout.height
@@ -484,13 +974,19 @@ class GameStateData:
             return '3'
         return 'E'
 
-    def initialize( self, layout, numGhostAgents ):
+    def initialize( self, layout, numGhostAgents, context=None ):
         """
-        Creates an initial game state from a layout array (see layout.py).
+        Creates an initial game state from a layout array (see layout.py),
+        belonging to the game of context (a new GameContext by default).
         """
+        if context is None: context = GameContext()
+        self.context = context
         self.food = layout.food.copy()
+        self.numFood = self.food.count()
+        self._foodPositions = None
+        self._foodPositionsEaten = ()
         #self.capsules = []
-        self.capsules = layout.capsules[:]
+        self.capsules = list(layout.capsules)
         self.layout = layout
         self.score = 0
         self.scoreChange = 0
@@ -501,8 +997,94 @@ class GameStateData:
             if not isPacman:
                 if numGhosts == numGhostAgents: continue # Max ghosts reached already
                 else: numGhosts += 1
-            self.agentStates.append( AgentState( Configuration( pos, Directions.STOP), isPacman) )
+            self.agentStates.append( AgentState( Configuration.intern( pos, Directions.STOP), isPacman) )
         self._eaten = [False for a in self.agentStates]
+        self._ownAll()
+        self._computeZobristHash()
+
+class ReadOnlyStateData(object):
+    """
+    A read-only view of a GameStateData, used to hand agents the live state
+    instead of a deep copy of it.
+
+    Reads go straight to the wrapped data, except that the food grid comes
+    back as a frozen copy, the agentStates as ReadOnlyAgentStates and the
+    agentStates, capsules and _eaten lists as copies, so nothing done to them
+    reaches the game.  Assigning an attribute or calling one of the update
+    methods raises an exception.
+
+    The frozen food and the ReadOnlyAgentStates are made on first use and
+    kept for as long as the wrapped data still has the same food bits and
+    AgentState objects.
+    """
+    __slots__ = ('_data', '_cache')
+
+    _COPIED_LISTS = ('capsules', '_eaten')
+    _WRITERS = ('initialize', 'removeFood', 'removeCapsule', '_ownAll', '_computeZobristHash')
+
+    def __init__( self, data ):
+        object.__setattr__( self, '_data', data )
+
+    def __getattr__( self, name ):
+        if name.endswith( 'ForUpdate' ) or name in ReadOnlyStateData._WRITERS:
+            raise AttributeError( 'Observations are read-only; %s is not available' % name )
+        value = getattr( self._data, name )
+        if name == 'food':
+            return self._frozenFood( value )
+        if name == 'agentStates':
+            return self._readOnlyAgentStates( value )
+        if name in ReadOnlyStateData._COPIED_LISTS:
+            return list( value )
+        return value
+
+    def _getCache( self ):
+        # [frozen food, the AgentStates and their ReadOnlyAgentStates], left
+        # unset until first needed so that making a view stays cheap
+        try:
+            return object.__getattribute__( self, '_cache' )
+        except AttributeError:
+            cache = [None, (), []]
+            object.__setattr__( self, '_cache', cache )
+            return cache
+
+    def _frozenFood( self, food ):
+        if getattr( food, 'frozen', False ): return food
+        cache = self._getCache()
+        cached = cache[0]
+        if cached is None or cached.bits != food.bits or cached.width != food.width or cached.height != food.height:
+            cached = cache[0] = food.copy().freeze()
+        return cached
+
+    def _readOnlyAgentStates( self, agentStates ):
+        cache = self._getCache()
+        sources = cache[1]
+        if len( sources ) != len( agentStates ) or \
+                [agentState for agentState, source in zip( agentStates, sources ) if agentState is not source]:
+            cache[1] = tuple( agentStates )
+            cache[2] = [ReadOnlyAgentState( agentState ) for agentState in agentStates]
+        return list( cache[2] )
+
+    def __setattr__( self, name, value ):
+        raise AttributeError( 'Observations are read-only; cannot set %s' % name )
+
+    def __delattr__( self, name ):
+        raise AttributeError( 'Observations are read-only; cannot delete %s' % name )
+
+    def deepCopy( self ):
+        return self._data.deepCopy()
+
+    def __eq__( self, other ):
+        if isinstance( other, ReadOnlyStateData ): other = other._data
+        return self._data == other
+
+    def __ne__( self, other ):
+        return not self == other
+
+    def __hash__( self ):
+        return hash( self._data )
+
+    def __str__( self ):
+        return str( self._data )
 
 try:
     import boinc
@@ -510,19 +1092,79 @@ try:
 except:
     _BOINC_ENABLED = False
 
+class GameContext:
+    """
+    The settings and forward-model accounting of one game.  Every state of
+    the game, every observation handed to an agent and every state an agent
+    generates from one refers to the same context, so games running side by
+    side in one process, in threads or interleaved, keep separate budgets.
+
+    currentIterations is what is left of the forward-model budget of the
+    current move; spend() and resetIterations() change it under a lock so
+    that several threads may search from the same game.
+    """
+    def __init__( self, maxIterations=None, timeLimit=None ):
+        if maxIterations is None: maxIterations = Game.maxIterations
+        if timeLimit is None: timeLimit = Game.timeLimit
+        self.maxIterations = maxIterations
+        self.currentIterations = maxIterations
+        self.timeLimit = timeLimit
+        self.forwardModelCalls = 0
+        self.totalFoodAndCapsules = 0
+        self.notLossButTime = False
+        self.lock = threading.Lock()
+
+    def spend( self, count=1 ):
+        """
+        Takes count forward-model calls off the budget; returns how many
+        were left before.
+        """
+        self.lock.acquire()
+        try:
+            remaining = self.currentIterations
+            self.currentIterations = remaining - count
+            return remaining
+        finally:
+            self.lock.release()
+
+    def resetIterations( self ):
+        """
+        Refills the budget for the next move; returns how many calls the
+        last move spent (including refused ones).
+        """
+        self.lock.acquire()
+        try:
+            spent = self.maxIterations - self.currentIterations
+            self.forwardModelCalls += spent
+            self.currentIterations = self.maxIterations
+            return spent
+        finally:
+            self.lock.release()
+
+    def __getstate__( self ):
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__( self, state ):
+        self.__dict__.update( state )
+        self.lock = threading.Lock()
+
 class Game:
     """
     The Game manages the control flow, soliciting actions from agents.
+
+    maxIterations and timeLimit are only the defaults of a GameContext made
+    without them; a running game keeps its own budget in self.context, which
+    runGames builds from the command line options.
     """
-    currentIterations=1000
     maxIterations=1000
     timeLimit=30
-    totalFoodAndCapsules=0
-    movementHistory=[]
-    notLossButTime = False
-    fileName=""
+    minMoveTime=0.01
 
-    def __init__( self, agents, display, rules, startingIndex=0, muteAgents=False, catchExceptions=False ):
+    def __init__( self, agents, display, rules, startingIndex=0, muteAgents=False, catchExceptions=False, context=None ):
+        if context is None: context = GameContext()
+        self.context = context
         self.agentCrashed = False
         self.agents = agents
         self.display = display
@@ -532,9 +1174,11 @@ class Game:
         self.muteAgents = muteAgents
         self.catchExceptions = catchExceptions
         self.moveHistory = []
+        self.recorder = None
         self.totalAgentTimes = [0 for agent in agents]
         self.totalAgentTimeWarnings = [0 for agent in agents]
         self.agentTimeout = False
+        self.forwardModelCalls = 0
         import cStringIO
         self.agentOutput = [cStringIO.StringIO() for agent in agents]
 
@@ -571,13 +1215,36 @@ class Game:
         sys.stderr = OLD_STDERR
 
 
+    def moveTimeLeft( self, agentIndex, gameStart ):
+        """
+        The seconds agentIndex may spend on its next move: the rules' per-move
+        timeout, cut to what is left of the game's timeLimit for the game
+        started at gameStart and, when timeouts are enforced (catchExceptions),
+        to what is left of the agent's total time allowance.  It is never less
+        than minMoveTime, so an anytime search always gets to look ahead.
+        """
+        timeLeft = min(self.rules.getMoveTimeout(agentIndex),
+                       self.context.timeLimit - (time.time() - gameStart))
+        if self.catchExceptions:
+            timeLeft = min(timeLeft, self.rules.getMaxTotalTime(agentIndex) - self.totalAgentTimes[agentIndex])
+        return max(Game.minMoveTime, timeLeft)
+
+    def makeObservation( self, agentIndex ):
+        """
+        Returns what agentIndex gets to see of the current state: a read-only
+        view of it, or a deep copy if the agent sets deepCopyObservations.
+        """
+        if getattr(self.agents[agentIndex], 'deepCopyObservations', False) or not hasattr(self.state, 'makeObservation'):
+            return self.state.deepCopy()
+        return self.state.makeObservation(agentIndex)
+
     def run( self ):
         """
         Main control loop for game play.
         """
         self.display.initialize(self.state.data)
         self.numMoves = 0
-        Game.totalFoodAndCapsules = self.state.getNumFood() + len(self.state.getCapsules());
+        self.context.totalFoodAndCapsules = self.state.getNumFood() + self.state.getNumCapsules()
 
         ###self.display.initialize(self.state.makeObservation(1).data)
         # inform learning agents of the game start
@@ -598,7 +1265,7 @@ class Game:
                         timed_func = TimeoutFunction(agent.registerInitialState, int(self.rules.getMaxStartupTime(i)))
                         try:
                             start_time = time.time()
-                            timed_func(self.state.deepCopy())
+                            timed_func(self.makeObservation(i))
                             time_taken = time.time() - start_time
                             self.totalAgentTimes[i] += time_taken
                         except TimeoutFunctionException:
@@ -612,7 +1279,7 @@ class Game:
                         self.unmute()
                         return
                 else:
-                    agent.registerInitialState(self.state.deepCopy())
+                    agent.registerInitialState(self.makeObservation(i))
                 ## TODO: could this exceed the total time
                 self.unmute()
 
@@ -620,13 +1287,15 @@ class Game:
         numAgents = len( self.agents )
         gameStart = time.time()
 
-        while (not self.gameOver) and (time.time()-gameStart < Game.timeLimit):
+        while (not self.gameOver) and (time.time()-gameStart < self.context.timeLimit):
             # Fetch the next agent
             agent = self.agents[agentIndex]
             move_time = 0
             skip_action = False
             # Generate an observation of the state
-            observation = self.state.deepCopy()
+            observation = self.makeObservation(agentIndex)
+            if hasattr(agent, 'setTimeLeft'):
+                agent.setTimeLeft(self.moveTimeLeft(agentIndex, gameStart))
 
             # Solicit an action
             action = None
@@ -673,7 +1342,9 @@ class Game:
                     self.unmute()
                     return
             else:
+                start_time = time.time()
                 action = agent.getAction(observation)
+                self.totalAgentTimes[agentIndex] += time.time() - start_time
             self.unmute()
 
             # Execute the action
@@ -688,6 +1359,8 @@ class Game:
                     return
             else:
                 self.state = self.state.generateSuccessor( agentIndex, action )
+            if self.recorder is not None:
+                self.recorder.record( agentIndex, action, self.state )
 
             # Change the display
             self.display.update( self.state.data )
@@ -698,20 +1371,15 @@ class Game:
             self.rules.process(self.state, self)
             # Track progress
             if agentIndex == numAgents + 1: self.numMoves += 1
-            if agentIndex == 0: Game.currentIterations = Game.maxIterations
+            if agentIndex == 0:
+                self.forwardModelCalls += self.context.resetIterations()
             # Next agent
             agentIndex = ( agentIndex + 1 ) % numAgents
 
             if _BOINC_ENABLED:
                 boinc.set_fraction_done(self.getProgress())
 
-        Game.notLossButTime = time.time()-gameStart < Game.timeLimit
-        Game.movementHistory = [y[1] for x,y in enumerate(self.moveHistory) if y[0] == 0]
-        if len(Game.fileName) > 0:
-            f = open(Game.fileName, "w")
-            for a in Game.movementHistory:
-                f.write(a + "\n")
-            f.close()
+        self.context.notLossButTime = time.time()-gameStart < self.context.timeLimit
         # inform a learning agent of the game result
         for agentIndex, agent in enumerate(self.agents):
             if "final" in dir( agent ) :
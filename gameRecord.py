@@ -0,0 +1,173 @@
+# gameRecord.py
+# -------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+The file format of recorded games (pacman.py -r) and the replay API.
+
+A RecordWriter streams a game to a file as it is played.  The file starts
+with a header holding the layout text and fingerprint, the number of
+agents and the keyframe interval, followed by blocks of
+
+  K  the move number, the agent due to move next and the codec encoding
+     of the state after that move
+  M  the next interval moves, packed into nibbles
+
+Moves are expected to go round the agents in turn, so a move only stores
+its action: one nibble, two moves to a byte.  A move by any other agent is
+escaped with ESCAPE and two more nibbles holding its index.
+
+A GameRecord reads a file back.  stateAt(n) decodes the keyframe at or
+before move n and plays at most interval moves from it, so seeking costs
+the same anywhere in the game.
+"""
+
+from game import Directions
+import codec
+import layout
+import struct
+
+MAGIC = 'PRC1'
+HEADER = struct.Struct('=4sQBHI')
+KEYFRAME = struct.Struct('=cIBH')
+MOVES = struct.Struct('=cHH')
+ACTIONS = [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST, Directions.STOP]
+ACTION_CODES = dict([(action, code) for code, action in enumerate(ACTIONS)])
+ESCAPE = 0xF
+
+class RecordWriter:
+    """
+    Streams the moves of one game to the file f, starting from state.
+
+    Moves are buffered until a block is full, so a game that is cut short
+    loses at most its last interval moves.
+    """
+    def __init__(self, f, state, interval=100):
+        self.f = f
+        self.interval = interval
+        self.numAgents = state.getNumAgents()
+        self.numMoves = 0
+        self.nextAgent = 0
+        self.nibbles = []
+        self.blockMoves = 0
+        lay = state.data.layout
+        text = '\n'.join(lay.layoutText)
+        f.write(HEADER.pack(MAGIC, lay.getFingerprint(), self.numAgents, interval, len(text)) + text)
+        self.writeKeyframe(state)
+
+    def writeKeyframe(self, state):
+        encoded = codec.encode(state)
+        self.f.write(KEYFRAME.pack('K', self.numMoves, self.nextAgent, len(encoded)) + encoded)
+
+    def writeMoves(self):
+        if len(self.nibbles) % 2: self.nibbles.append(0)
+        packed = ''.join([chr(high << 4 | low) for high, low in zip(self.nibbles[::2], self.nibbles[1::2])])
+        self.f.write(MOVES.pack('M', self.blockMoves, len(packed)) + packed)
+        self.nibbles = []
+        self.blockMoves = 0
+
+    def record(self, agentIndex, action, state):
+        """
+        Adds the move of agentIndex, which led to state.
+        """
+        if action not in ACTION_CODES: raise Exception('Cannot record the action ' + str(action))
+        if agentIndex != self.nextAgent:
+            self.nibbles += [ESCAPE, agentIndex >> 4, agentIndex & 0xF]
+        self.nibbles.append(ACTION_CODES[action])
+        self.nextAgent = (agentIndex + 1) % self.numAgents
+        self.numMoves += 1
+        self.blockMoves += 1
+        if self.blockMoves == self.interval:
+            self.writeMoves()
+            self.writeKeyframe(state)
+
+    def close(self):
+        if self.blockMoves: self.writeMoves()
+        self.f.close()
+
+class GameRecord:
+    """
+    A recorded game, read from the bytes of a RecordWriter file.
+    """
+    def __init__(self, data):
+        magic, fingerprint, self.numAgents, self.interval, textLength = HEADER.unpack_from(data)
+        if magic != MAGIC: raise Exception('This is not a recorded game')
+        offset = HEADER.size
+        self.layout = layout.sharedLayout(data[offset:offset + textLength].split('\n'))
+        if self.layout.getFingerprint() != fingerprint: raise Exception('The recorded layout is corrupt')
+        codec.registerLayout(self.layout)
+        offset += textLength
+        # (move number, next agent, encoded state, number of moves, packed moves) per block
+        self.blocks = []
+        while offset < len(data):
+            kind, moveNumber, nextAgent, length = KEYFRAME.unpack_from(data, offset)
+            offset += KEYFRAME.size
+            keyframe = data[offset:offset + length]
+            offset += length
+            count, packed = 0, ''
+            if offset < len(data) and data[offset] == 'M':
+                kind, count, length = MOVES.unpack_from(data, offset)
+                offset += MOVES.size
+                packed = data[offset:offset + length]
+                offset += length
+            self.blocks.append((moveNumber, nextAgent, keyframe, count, packed))
+        self.numMoves = self.blocks[-1][0] + self.blocks[-1][3]
+
+    def load(path):
+        f = open(path, 'rb')
+        try: return GameRecord(f.read())
+        finally: f.close()
+    load = staticmethod(load)
+
+    def blockMoves(self, index):
+        """
+        The (agentIndex, action) moves of block index.
+        """
+        moveNumber, agentIndex, keyframe, count, packed = self.blocks[index]
+        nibbles = []
+        for byte in packed:
+            byte = ord(byte)
+            nibbles += [byte >> 4, byte & 0xF]
+        moves = []
+        i = 0
+        while len(moves) < count:
+            if nibbles[i] == ESCAPE:
+                agentIndex = nibbles[i + 1] << 4 | nibbles[i + 2]
+                i += 3
+            moves.append((agentIndex, ACTIONS[nibbles[i]]))
+            agentIndex = (agentIndex + 1) % self.numAgents
+            i += 1
+        return moves
+
+    def getMoves(self, start=0):
+        """
+        The (agentIndex, action) moves from move start to the end.
+        """
+        if not 0 <= start <= self.numMoves: raise IndexError('The game has no move %d' % start)
+        moves = []
+        for index in range(min(start / self.interval, len(self.blocks) - 1), len(self.blocks)):
+            moves += self.blockMoves(index)
+        return moves[start % self.interval:]
+
+    def stateAt(self, n, context=None):
+        """
+        The GameState after the first n moves.
+        """
+        if not 0 <= n <= self.numMoves: raise IndexError('The game has no move %d' % n)
+        index = min(n / self.interval, len(self.blocks) - 1)
+        moveNumber, nextAgent, keyframe, count, packed = self.blocks[index]
+        state = codec.decode(keyframe, context)
+        if n > moveNumber:
+            for agentIndex, action in self.blockMoves(index)[:n - moveNumber]:
+                state = state.generateSuccessor(agentIndex, action)
+        return state
@@ -14,52 +14,129 @@
 
 from util import manhattanDistance
 from game import Grid
+from game import BitGrid
+from game import MoveTable
+from game import Directions
+from array import array
+from collections import deque
+import hashlib
+import marshal
+import mmap
 import os
 import random
+import struct
 
 VISIBILITY_MATRIX_CACHE = {}
+MOVE_TABLE_CACHE = {}
+SHARED_LAYOUT_CACHE = {}
+MAZE_DISTANCE_CACHE = {}
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache')
 
-class Layout:
+class Layout(object):
     """
     A Layout manages the static information about the game board.
+
+    Layouts are read-only once parsed: the walls and food grids are frozen
+    and the capsules and agent positions are tuples, so every GameState and
+    every observation of a game shares one Layout by reference.  Code that
+    wants to edit a board should work on clone().
     """
 
-    def __init__(self, layoutText):
+    def __init__(self, layoutText, compiled=None):
         self.width = len(layoutText[0])
         self.height= len(layoutText)
-        self.walls = Grid(self.width, self.height, False)
-        self.food = Grid(self.width, self.height, False)
-        self.capsules = []
-        self.agentPositions = []
-        self.numGhosts = 0
-        self.processLayoutText(layoutText)
+        self.walls = BitGrid(self.width, self.height, False)
+        self.food = BitGrid(self.width, self.height, False)
+        if compiled is None:
+            self.capsules = []
+            self.agentPositions = []
+            self.numGhosts = 0
+            self.processLayoutText(layoutText)
+        else:
+            self.walls.bits, self.food.bits, self.capsules, self.agentPositions, self.numGhosts = compiled
         self.layoutText = layoutText
-        self.totalFood = len(self.food.asList())
-        # self.initializeVisibilityMatrix()
+        self.totalFood = self.food.count()
+        self.moveTable = None
+        self.mazeDistances = None
+        self.visibility = None
+        self.wallsKey = (self.width, self.height, self.walls.bits)
+        self.fingerprint = None
+        self.name = None
+        self.walls.freeze()
+        self.food.freeze()
+        self.capsules = tuple(self.capsules)
+        self.agentPositions = tuple(self.agentPositions)
 
     def getNumGhosts(self):
         return self.numGhosts
 
+    def checkWalls(self):
+        """
+        Drops the move table, maze distances and visibility of a clone() whose
+        walls were edited after they were looked up.
+        """
+        key = (self.width, self.height, self.walls.bits)
+        if key != self.wallsKey:
+            self.wallsKey = key
+            self.moveTable = None
+            self.mazeDistances = None
+            self.visibility = None
+
     def initializeVisibilityMatrix(self):
-        global VISIBILITY_MATRIX_CACHE
-        if reduce(str.__add__, self.layoutText) not in VISIBILITY_MATRIX_CACHE:
-            from game import Directions
-            vecs = [(-0.5,0), (0.5,0),(0,-0.5),(0,0.5)]
-            dirs = [Directions.NORTH, Directions.SOUTH, Directions.WEST, Directions.EAST]
-            vis = Grid(self.width, self.height, {Directions.NORTH:set(), Directions.SOUTH:set(), Directions.EAST:set(), Directions.WEST:set(), Directions.STOP:set()})
-            for x in range(self.width):
-                for y in range(self.height):
-                    if self.walls[x][y] == False:
-                        for vec, direction in zip(vecs, dirs):
-                            dx, dy = vec
-                            nextx, nexty = x + dx, y + dy
-                            while (nextx + nexty) != int(nextx) + int(nexty) or not self.walls[int(nextx)][int(nexty)] :
-                                vis[x][y][direction].add((nextx, nexty))
-                                nextx, nexty = x + dx, y + dy
-            self.visibility = vis
-            VISIBILITY_MATRIX_CACHE[reduce(str.__add__, self.layoutText)] = vis
-        else:
-            self.visibility = VISIBILITY_MATRIX_CACHE[reduce(str.__add__, self.layoutText)]
+        """
+        Looks up the Visibility of this layout, computing it only the first
+        time any layout with the same walls asks for it.
+        """
+        if not self.walls.frozen: self.checkWalls()
+        key = (self.width, self.height, self.walls.bits)
+        if key not in VISIBILITY_MATRIX_CACHE:
+            VISIBILITY_MATRIX_CACHE[key] = Visibility.load(self.walls)
+        self.visibility = VISIBILITY_MATRIX_CACHE[key]
+
+    def getMoveTable(self):
+        """
+        Returns the MoveTable of this layout, compiling it only the first time
+        any layout with the same walls asks for it.
+        """
+        if not self.walls.frozen: self.checkWalls()
+        if self.moveTable is None:
+            key = (self.width, self.height, self.walls.bits)
+            if key not in MOVE_TABLE_CACHE:
+                MOVE_TABLE_CACHE[key] = MoveTable(self.walls)
+            self.moveTable = MOVE_TABLE_CACHE[key]
+        return self.moveTable
+
+    def getFingerprint(self):
+        """
+        A 64-bit id of layoutText that is the same in every process.
+        """
+        if self.fingerprint is None:
+            digest = hashlib.sha1('\n'.join(self.layoutText)).digest()
+            self.fingerprint = struct.unpack('=Q', digest[:8])[0]
+        return self.fingerprint
+
+    def getMazeDistances(self):
+        """
+        Returns the MazeDistances of this layout.  A read-only layout loads
+        them from the disk cache, building and saving them the first time;
+        a clone(), whose walls may have been edited, builds them in memory.
+        """
+        if not self.walls.frozen: self.checkWalls()
+        if self.mazeDistances is None:
+            key = (self.width, self.height, self.walls.bits)
+            if key not in MAZE_DISTANCE_CACHE:
+                if self.walls.frozen:
+                    MAZE_DISTANCE_CACHE[key] = MazeDistances.load(self.walls, self.layoutText)
+                else:
+                    MAZE_DISTANCE_CACHE[key] = MazeDistances(self.walls)
+            self.mazeDistances = MAZE_DISTANCE_CACHE[key]
+        return self.mazeDistances
+
+    def mazeDistance(self, a, b):
+        """
+        The length of the shortest path between grid points a and b.
+        """
+        return self.getMazeDistances().distance(a, b)
 
     def isWall(self, pos):
         x, col = pos
@@ -83,14 +160,42 @@ class Layout:
         return pos
 
     def isVisibleFrom(self, ghostPos, pacPos, pacDirection):
-        row, col = [int(x) for x in pacPos]
-        return ghostPos in self.visibility[row][col][pacDirection]
+        if self.visibility is None or not self.walls.frozen: self.initializeVisibilityMatrix()
+        return self.visibility.isVisibleFrom(ghostPos, pacPos, pacDirection)
 
     def __str__(self):
         return "\n".join(self.layoutText)
 
+    def clone(self):
+        """
+        Returns a private copy of this layout whose walls, food, capsules and
+        agentPositions may be modified in place.
+        """
+        layout = Layout(self.layoutText[:], self.compile())
+        layout.walls = self.walls.copy()
+        layout.food = self.food.copy()
+        layout.totalFood = layout.food.count()
+        layout.capsules = list(self.capsules)
+        layout.agentPositions = list(self.agentPositions)
+        layout.name = self.name
+        return layout
+
     def deepCopy(self):
-        return Layout(self.layoutText[:])
+        return self.clone()
+
+    def compile(self):
+        """
+        What Layout(layoutText, compiled) needs to rebuild this layout
+        without parsing layoutText.
+        """
+        return (self.walls.bits, self.food.bits, tuple(self.capsules), tuple(self.agentPositions), self.numGhosts)
+
+    def __reduce__(self):
+        # A read-only layout pickles as its text and unpickles to the layout
+        # the receiving process already shares for that text
+        if self.walls.frozen and self.food.frozen:
+            return (sharedLayout, (self.layoutText, self.name))
+        return (restoreClone, (self.layoutText, self.walls, self.food, self.capsules, self.agentPositions, self.name))
 
     def processLayoutText(self, layoutText):
         """
@@ -128,20 +233,399 @@ class Layout:
         elif layoutChar in  ['1', '2', '3', '4']:
             self.agentPositions.append( (int(layoutChar), (x,y)))
             self.numGhosts += 1
-def getLayout(name, back = 2):
-    if name.endswith('.lay'):
-        layout = tryToLoad('layouts/' + name)
-        if layout == None: layout = tryToLoad(name)
-    else:
-        layout = tryToLoad('layouts/' + name + '.lay')
-        if layout == None: layout = tryToLoad(name + '.lay')
-    if layout == None and back >= 0:
-        curdir = os.path.abspath('.')
-        os.chdir('..')
-        layout = getLayout(name, back -1)
-        os.chdir(curdir)
+
+class Visibility:
+    """
+    What Pacman can see looking down a corridor: for every open cell and
+    direction, the grid points and half points (where scared ghosts stand)
+    between the cell and the first wall that way.
+
+    Each sight line runs along one row or column, so it is kept as a bitset
+    over that line at half-cell resolution, bit 2 * x + 1 standing for
+    x + 0.5.  The sets of a line are swept in one pass from its walls, and
+    isVisibleFrom is a single bit test.  load() keeps the sets in CACHE_DIR
+    under a fingerprint of the walls, so processes reuse them.
+    """
+    MAGIC = 'PMV1'
+
+    def __init__(self, walls, sightLines=None):
+        self.width = walls.width
+        self.height = walls.height
+        if sightLines is None:
+            sightLines = self.build(walls)
+        self.sightLines = sightLines
+
+    def build(self, walls):
+        width, height = self.width, self.height
+        north, south, east, west = [[0] * (width * height) for i in range(4)]
+        for x in range(width):
+            # The walls of the column nearest above and below each cell
+            above = height
+            for y in range(height - 1, -1, -1):
+                if walls[x][y]: above = y
+                else: north[x * height + y] = ((1 << (2 * above)) - 1) ^ ((1 << (2 * y + 1)) - 1)
+            below = -1
+            for y in range(height):
+                if walls[x][y]: below = y
+                else: south[x * height + y] = ((1 << (2 * y)) - 1) ^ ((1 << (2 * below + 1)) - 1)
+        for y in range(height):
+            right = width
+            for x in range(width - 1, -1, -1):
+                if walls[x][y]: right = x
+                else: east[x * height + y] = ((1 << (2 * right)) - 1) ^ ((1 << (2 * x + 1)) - 1)
+            left = -1
+            for x in range(width):
+                if walls[x][y]: left = x
+                else: west[x * height + y] = ((1 << (2 * x)) - 1) ^ ((1 << (2 * left + 1)) - 1)
+        return {Directions.NORTH: north, Directions.SOUTH: south, Directions.EAST: east, Directions.WEST: west}
+
+    def isVisibleFrom(self, ghostPos, pacPos, pacDirection):
+        """
+        Whether a ghost at ghostPos is in sight of Pacman at pacPos facing
+        pacDirection.  Pacman sees nothing when stopped.
+        """
+        if pacDirection not in self.sightLines: return False
+        x, y = [int(c) for c in pacPos]
+        gx, gy = ghostPos[0] * 2, ghostPos[1] * 2
+        if pacDirection in (Directions.NORTH, Directions.SOUTH):
+            line, position = gx == 2 * x, gy
+        else:
+            line, position = gy == 2 * y, gx
+        if not line or position != int(position) or position < 0: return False
+        return (self.sightLines[pacDirection][x * self.height + y] >> int(position)) & 1 == 1
+
+    def fingerprint(walls):
+        return hashlib.sha1('%d %d %x' % (walls.width, walls.height, walls.bits)).hexdigest()
+    fingerprint = staticmethod(fingerprint)
+
+    def load(walls):
+        """
+        Returns the sight lines for walls from the disk cache, computing and
+        saving them if the cache has no valid copy.
+        """
+        path = os.path.join(CACHE_DIR, Visibility.fingerprint(walls) + '.vis')
+        try:
+            f = open(path, 'rb')
+            try:
+                magic, width, height, sightLines = marshal.load(f)
+            finally:
+                f.close()
+            if (magic, width, height) == (Visibility.MAGIC, walls.width, walls.height):
+                return Visibility(walls, sightLines)
+        except (IOError, EOFError, ValueError, TypeError):
+            pass
+        visibility = Visibility(walls)
+        saveCacheFile(path, lambda f: marshal.dump((Visibility.MAGIC, visibility.width, visibility.height, visibility.sightLines), f))
+        return visibility
+    load = staticmethod(load)
+
+class MazeDistances:
+    """
+    The shortest-path distance between every pair of open cells of a layout.
+
+    Open cells are numbered column by column, and the distance from cell i
+    to cell j is entry i * size + j of a flat array of unsigned shorts, so a
+    lookup costs one dict access per position and one array access.  Cells
+    that cannot reach each other have distance None.
+
+    load() keeps the table in CACHE_DIR under the SHA-1 of the layout text
+    and memory-maps it on later runs, so the table is built once per layout
+    and the processes of a --workers run share its pages.
+    """
+    MAGIC = 'PMD1'
+    HEADER = struct.Struct('=4sHHI')
+    UNREACHABLE = 0xFFFF
+
+    def __init__(self, walls, distances=None):
+        self.width = walls.width
+        self.height = walls.height
+        self.cells = [(x, y) for x in range(walls.width) for y in range(walls.height) if not walls[x][y]]
+        self.ids = dict([(pos, i) for i, pos in enumerate(self.cells)])
+        self.size = len(self.cells)
+        self.offset = 0
+        self.buffer = None
+        if distances is None:
+            distances = self.build(walls)
+        self.distances = distances
+        if isinstance(distances, array):
+            self.distance = self.arrayDistance
+
+    def build(self, walls):
+        """
+        Runs a breadth-first search from every open cell.
+        """
+        size = self.size
+        if size > self.UNREACHABLE: raise Exception('The layout has too many open cells for a distance table')
+        neighbours = []
+        for x, y in self.cells:
+            cells = [(x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)]
+            neighbours.append([self.ids[cell] for cell in cells if cell in self.ids])
+        distances = array('H', [self.UNREACHABLE]) * (size * size)
+        for source in range(size):
+            row = source * size
+            distances[row + source] = 0
+            queue = deque([source])
+            while queue:
+                cell = queue.popleft()
+                step = distances[row + cell] + 1
+                for next in neighbours[cell]:
+                    if distances[row + next] == self.UNREACHABLE:
+                        distances[row + next] = step
+                        queue.append(next)
+        return distances
+
+    def arrayDistance(self, a, b):
+        d = self.distances[self.ids[a] * self.size + self.ids[b]]
+        if d == self.UNREACHABLE: return None
+        return d
+
+    def distance(self, a, b):
+        """
+        The maze distance between grid points a and b.
+        """
+        d = self._unpack(self.distances, self.offset + 2 * (self.ids[a] * self.size + self.ids[b]))[0]
+        if d == self.UNREACHABLE: return None
+        return d
+    _unpack = struct.Struct('=H').unpack_from
+
+    def nbytes(self):
+        return self.size * self.size * 2
+
+    def close(self):
+        if self.buffer is not None:
+            self.buffer.close()
+            self.buffer = None
+
+    def cachePath(layoutText):
+        digest = hashlib.sha1('\n'.join(layoutText)).hexdigest()
+        return os.path.join(CACHE_DIR, digest + '.dist')
+    cachePath = staticmethod(cachePath)
+
+    def load(walls, layoutText):
+        """
+        Returns the distances of layoutText from the disk cache, building and
+        saving them if the cache has no valid copy.  An unwritable cache
+        only costs the rebuild.
+        """
+        path = MazeDistances.cachePath(layoutText)
+        table = MazeDistances(walls, ())
+        try:
+            f = open(path, 'rb')
+        except IOError:
+            f = None
+        if f is not None:
+            try:
+                try:
+                    buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                except (mmap.error, ValueError):
+                    buffer = None
+            finally:
+                f.close()
+            if buffer is not None:
+                header = (MazeDistances.MAGIC, table.width, table.height, table.size)
+                if len(buffer) == MazeDistances.HEADER.size + table.nbytes() and \
+                        MazeDistances.HEADER.unpack_from(buffer) == header:
+                    table.buffer = table.distances = buffer
+                    table.offset = MazeDistances.HEADER.size
+                    return table
+                buffer.close()
+        table = MazeDistances(walls)
+        table.save(path)
+        return table
+    load = staticmethod(load)
+
+    def save(self, path):
+        def write(f):
+            f.write(self.HEADER.pack(self.MAGIC, self.width, self.height, self.size))
+            self.distances.tofile(f)
+        saveCacheFile(path, write)
+
+def saveCacheFile(path, write):
+    """
+    Writes a cache file by calling write on a temporary file that is then
+    renamed to path, so concurrent runs never read a partial file.  An
+    unwritable cache is ignored.
+    """
+    temp = '%s.%d.tmp' % (path, os.getpid())
+    try:
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory): os.makedirs(directory)
+        f = open(temp, 'wb')
+        try:
+            write(f)
+        finally:
+            f.close()
+        os.rename(temp, path)
+    except (IOError, OSError):
+        if os.path.exists(temp): os.remove(temp)
+
+def sharedLayout(layoutText, name=None):
+    """
+    Returns the one read-only Layout this process keeps for layoutText,
+    named name unless it already has a name.
+    """
+    key = '\n'.join(layoutText)
+    if key not in SHARED_LAYOUT_CACHE:
+        SHARED_LAYOUT_CACHE[key] = Layout(list(layoutText))
+    layout = SHARED_LAYOUT_CACHE[key]
+    if layout.name is None: layout.name = name
     return layout
 
+def restoreClone(layoutText, walls, food, capsules, agentPositions, name=None):
+    """
+    Unpickles a Layout.clone().
+    """
+    layout = Layout(layoutText)
+    layout.walls = walls
+    layout.food = food
+    layout.totalFood = food.count()
+    layout.capsules = capsules
+    layout.agentPositions = agentPositions
+    layout.name = name
+    return layout
+
+class LayoutRegistry:
+    """
+    Finds and loads layout files by name.
+
+    The registry lists the layout directories once, in the order getLayout
+    has always searched them: layouts/ and then the directory itself, for
+    the current directory and up to two levels above it.  Names it has not
+    indexed, such as paths or files created since, are looked up in the
+    same directories on each call.
+
+    Each foo.lay is compiled to a foo.layc beside it that holds the source
+    size, modification time and hash followed by the marshalled walls and
+    food bits, capsules, agent positions and text, so loading a layout is a
+    stat and a single read.  A .layc whose source has changed is rebuilt;
+    if the source was only touched, just the .layc's header is updated.
+    """
+    MAGIC = 'PLC1'
+    HEADER = struct.Struct('=4sqd20s')
+
+    def __init__(self, roots=None, back=2):
+        if roots is None:
+            roots = []
+            for level in range(back + 1):
+                base = os.path.abspath(os.path.join(*(['.'] + ['..'] * level)))
+                roots += [os.path.join(base, 'layouts'), base]
+        self.roots = roots
+        self.index = None
+        self.fingerprints = None
+
+    def refresh(self):
+        """
+        Lists the layout directories again.
+        """
+        self.index = {}
+        self.fingerprints = None
+        for root in self.roots:
+            try:
+                names = os.listdir(root)
+            except OSError:
+                continue
+            for name in names:
+                if name.endswith('.lay') and name not in self.index:
+                    self.index[name] = os.path.join(root, name)
+
+    def find(self, name):
+        """
+        The path of the layout file for name, or None.
+        """
+        if self.index is None: self.refresh()
+        if not name.endswith('.lay'): name = name + '.lay'
+        if name in self.index: return self.index[name]
+        for root in self.roots:
+            path = os.path.join(root, name)
+            if os.path.isfile(path): return path
+        return None
+
+    def findFingerprint(self, fingerprint):
+        """
+        The path of the indexed layout file whose Layout.getFingerprint() is
+        fingerprint, or None.  The fingerprints of all indexed files are
+        worked out the first time one is asked for, and kept until refresh().
+        """
+        if self.index is None: self.refresh()
+        if self.fingerprints is None:
+            self.fingerprints = {}
+            for name in sorted(self.index):
+                path = self.index[name]
+                self.fingerprints.setdefault(self.loadFile(path).getFingerprint(), path)
+        return self.fingerprints.get(fingerprint)
+
+    def load(self, name):
+        path = self.find(name)
+        if path is None: return None
+        layout = self.loadFile(path)
+        layout.name = os.path.basename(path)[:-len('.lay')]
+        return layout
+
+    def loadFile(self, path):
+        """
+        Loads the layout at path from its .layc, compiling it if the .layc
+        is missing or stale.
+        """
+        stat = os.stat(path)
+        compiledPath = path + 'c'
+        try:
+            f = open(compiledPath, 'rb')
+            try:
+                data = f.read()
+            finally:
+                f.close()
+        except IOError:
+            data = ''
+        source = None
+        if len(data) > self.HEADER.size:
+            magic, size, mtime, digest = self.HEADER.unpack_from(data)
+            if magic == self.MAGIC:
+                if (size, mtime) != (stat.st_size, stat.st_mtime):
+                    source = self.readSource(path)
+                if source is None or hashlib.sha1(source).digest() == digest:
+                    try:
+                        layoutText, compiled = marshal.loads(data[self.HEADER.size:])
+                        layout = Layout(layoutText, compiled)
+                    except (EOFError, ValueError, TypeError):
+                        layout = None
+                    if layout is not None:
+                        if source is not None:
+                            # The source was only touched: record its new time so the
+                            # next load does not hash the source again
+                            header = self.HEADER.pack(self.MAGIC, stat.st_size, stat.st_mtime, digest)
+                            saveCacheFile(compiledPath, lambda f: f.write(header + data[self.HEADER.size:]))
+                        return layout
+        if source is None: source = self.readSource(path)
+        layout = Layout([line.strip() for line in source.splitlines()])
+        header = self.HEADER.pack(self.MAGIC, stat.st_size, stat.st_mtime, hashlib.sha1(source).digest())
+        record = marshal.dumps((layout.layoutText, layout.compile()))
+        saveCacheFile(compiledPath, lambda f: f.write(header + record))
+        return layout
+
+    def readSource(path):
+        f = open(path, 'rb')
+        try: return f.read()
+        finally: f.close()
+    readSource = staticmethod(readSource)
+
+REGISTRY = None
+
+def getRegistry():
+    """
+    The LayoutRegistry of this process, indexed on first use.
+    """
+    global REGISTRY
+    if REGISTRY is None: REGISTRY = LayoutRegistry()
+    if REGISTRY.index is None: REGISTRY.refresh()
+    return REGISTRY
+
+def getLayout(name):
+    """
+    Loads the layout called name, such as 'mediumClassic' or 'layouts/foo.lay',
+    or returns None if no layout directory has it.
+    """
+    return getRegistry().load(name)
+
 def tryToLoad(fullname):
     if(not os.path.exists(fullname)): return None
     f = open(fullname)
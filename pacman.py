@@ -41,9 +41,12 @@ The keys are 'a', 's', 'd', and 'w' to move (or arrow keys).  Have fun!
 """
 
 from game import GameStateData
+from game import ReadOnlyStateData
 from game import Game
+from game import GameContext
 from game import Directions
 from game import Actions
+from game import Configuration
 from util import nearestPoint
 from util import manhattanDistance
 import util, layout
@@ -95,7 +98,9 @@ class GameState:
 
         # Let agent's logic deal with its action's effects on the board
         if agentIndex == 0:  # Pacman is moving
-            state.data._eaten = [False for i in range(state.getNumAgents())]
+            if True in state.data._eaten:
+                state.data._eaten = [False for i in range(state.getNumAgents())]
+                state.data._ownsEaten = True
             PacmanRules.applyAction( state, action )
         else:                # A ghost is moving
             GhostRules.applyAction( state, action, agentIndex )
@@ -104,7 +109,7 @@ class GameState:
         if agentIndex == 0:
             state.data.scoreChange += -TIME_PENALTY # Penalty for waiting around
         else:
-            GhostRules.decrementTimer( state.data.agentStates[agentIndex] )
+            GhostRules.decrementTimer( state.data.getAgentStateForUpdate( agentIndex ) )
 
         # Resolve multi-agent effects
         GhostRules.checkDeath( state, agentIndex )
@@ -112,36 +117,64 @@ class GameState:
         # Book keeping
         state.data._agentMoved = agentIndex
         state.data.score += state.data.scoreChange
+        state.data.getZobristHash()
         return state
 
     def getLegalPacmanActions( self ):
-        actions = self.getLegalActions( 0 )
-        if Directions.STOP in actions: actions.remove(Directions.STOP)
-        return actions
+        if self.isWin() or self.isLose(): return []
+        return list( self.data.layout.getMoveTable().getPacmanActions( self.data.agentStates[0].configuration ) )
 
     def getAllPossibleActions( self ):
         return [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST];
 
     def checkLegalAction( self, action ):
-        legal = self.getLegalActions(0);
-        if action in legal:
+        if self.isWin() or self.isLose(): return 0;
+        if PacmanRules.isLegalAction( self, action ):
             return 1;
         return 0;
 
     def generatePacmanSuccessor( self, action ):
         if not self.checkLegalAction(action):
             action = Directions.STOP;
-        Game.currentIterations -= 1
-        if Game.currentIterations <= 0:
+        if self.data.context.spend(1) <= 1:
             return None
         """
         Generates the successor state after the specified pacman move
         """
-        newState = self.generateSuccessor(0, action)
-        for i in range(1,self.getNumAgents()):
-            actions = newState.getLegalActions(i)
+        return self._moveGhostsRandomly( self.generateSuccessor(0, action) )
+
+    def generatePacmanSuccessors( self, actions=None ):
+        """
+        Returns [generatePacmanSuccessor(action) for action in actions] in one
+        pass (actions defaults to getLegalPacmanActions()).  Each action still
+        costs one forward-model iteration, and once the budget runs out the
+        remaining entries are None, but the legality and budget checks are
+        done once for all the siblings.
+        """
+        if actions == None: actions = self.getLegalPacmanActions()
+        remaining = self.data.context.spend(len(actions))
+        moveTable = self.data.layout.getMoveTable()
+        if self.isWin() or self.isLose():
+            legal = ()
+        else:
+            legal = moveTable.getPossibleActions( self.data.agentStates[0].configuration )
+        successors = []
+        for action in actions:
+            remaining -= 1
+            if remaining <= 0:
+                successors.append(None)
+                continue
+            if action not in legal:
+                action = Directions.STOP
+            successors.append( self._moveGhostsRandomly( self.generateSuccessor(0, action), moveTable ) )
+        return successors
+
+    def _moveGhostsRandomly( self, newState, moveTable=None ):
+        if moveTable is None: moveTable = newState.data.layout.getMoveTable()
+        for i in range(1,newState.getNumAgents()):
             if newState.isWin() or newState.isLose():
                 break;
+            actions = moveTable.getGhostActions( newState.data.agentStates[i].configuration )
             if len(actions) > 0:
                 newState = newState.generateSuccessor(i, actions[random.randint(0, len(actions) - 1)])
             else:
@@ -188,8 +221,17 @@ class GameState:
         """
         return self.data.capsules
 
+    def getNumCapsules( self ):
+        return len( self.data.capsules )
+
     def getNumFood( self ):
-        return self.data.food.count()
+        return self.data.numFood
+
+    def getFoodPositions( self ):
+        """
+        Returns a frozenset of the (x,y) positions of the remaining food.
+        """
+        return self.data.getFoodPositions()
 
     def getFood(self):
         """
@@ -246,6 +288,12 @@ class GameState:
         state.data = self.data.deepCopy()
         return state
 
+    def makeObservation( self, agentIndex ):
+        """
+        Returns a read-only view of this state for agentIndex to look at.
+        """
+        return ReadOnlyGameState( self )
+
     def __eq__( self, other ):
         """
         Allows two states to be compared.
@@ -262,11 +310,42 @@ class GameState:
 
         return str(self.data)
 
-    def initialize( self, layout, numGhostAgents=1000 ):
+    def getContext( self ):
+        """
+        Returns the GameContext of the game this state belongs to; its
+        currentIterations is what is left of the forward-model budget.
+        """
+        return self.data.context
+
+    def withContext( self, context ):
+        """
+        Returns a copy of this state that, like every state generated from
+        it, spends the budget of context instead.
+        """
+        state = self.deepCopy()
+        state.data.context = context
+        return state
+
+    def initialize( self, layout, numGhostAgents=1000, context=None ):
         """
         Creates an initial game state from a layout array (see layout.py).
         """
-        self.data.initialize(layout, numGhostAgents)
+        self.data.initialize(layout, numGhostAgents, context)
+
+class ReadOnlyGameState(GameState):
+    """
+    A GameState that shares the data of the state it was made from instead of
+    copying it.  Every accessor and successor method works as usual, but the
+    view itself cannot be changed; deepCopy() returns an ordinary GameState.
+    """
+    def __init__( self, state ):
+        self.__dict__['data'] = ReadOnlyStateData( state.data )
+
+    def __setattr__( self, name, value ):
+        raise AttributeError( 'Observations are read-only; cannot set %s' % name )
+
+    def __delattr__( self, name ):
+        raise AttributeError( 'Observations are read-only; cannot delete %s' % name )
 
 ############################################################################
 #                     THE HIDDEN SECRETS OF PACMAN                         #
@@ -286,11 +365,12 @@ class ClassicGameRules:
     def __init__(self, timeout=1):
         self.timeout = timeout
 
-    def newGame( self, layout, pacmanAgent, ghostAgents, display, quiet = False, catchExceptions=False):
+    def newGame( self, layout, pacmanAgent, ghostAgents, display, quiet = False, catchExceptions=False, context=None):
         agents = [pacmanAgent] + ghostAgents[:layout.getNumGhosts()]
+        if context is None: context = GameContext()
         initState = GameState()
-        initState.initialize( layout, len(ghostAgents) )
-        game = Game(agents, display, self, catchExceptions=catchExceptions)
+        initState.initialize( layout, len(ghostAgents), context )
+        game = Game(agents, display, self, catchExceptions=catchExceptions, context=context)
         game.state = initState
         self.initialState = initState.deepCopy()
         self.quiet = quiet
@@ -346,22 +426,31 @@ class PacmanRules:
         """
         Returns a list of possible actions.
         """
-        return Actions.getPossibleActions( state.getPacmanState().configuration, state.data.layout.walls )
+        conf = state.data.agentStates[0].configuration
+        return list( state.data.layout.getMoveTable().getPossibleActions( conf ) )
     getLegalActions = staticmethod( getLegalActions )
 
+    def isLegalAction( state, action ):
+        conf = state.data.agentStates[0].configuration
+        return action in state.data.layout.getMoveTable().getPossibleActions( conf )
+    isLegalAction = staticmethod( isLegalAction )
+
     def applyAction( state, action ):
         """
         Edits the state to reflect the results of the action.
         """
-        legal = PacmanRules.getLegalActions( state )
-        if action not in legal:
+        if not PacmanRules.isLegalAction( state, action ):
             action = Directions.STOP;
 
-        pacmanState = state.data.agentStates[0]
+        pacmanState = state.data.getAgentStateForUpdate( 0 )
 
         # Update Configuration
-        vector = Actions.directionToVector( action, PacmanRules.PACMAN_SPEED )
-        pacmanState.configuration = pacmanState.configuration.generateSuccessor( vector )
+        if PacmanRules.PACMAN_SPEED == 1:
+            moveTable = state.data.layout.getMoveTable()
+            pacmanState.configuration = moveTable.getSuccessor( pacmanState.configuration, action )
+        else:
+            vector = Actions.directionToVector( action, PacmanRules.PACMAN_SPEED )
+            pacmanState.configuration = pacmanState.configuration.generateSuccessor( vector )
 
         # Eat
         next = pacmanState.configuration.getPosition()
@@ -376,21 +465,18 @@ class PacmanRules:
         # Eat food
         if state.data.food[x][y]:
             state.data.scoreChange += 10
-            state.data.food = state.data.food.copy()
-            state.data.food[x][y] = False
+            state.data.removeFood( position )
             state.data._foodEaten = position
-            # TODO: cache numFood?
-            numFood = state.getNumFood()
-            if numFood == 0 and not state.data._lose:
+            if state.data.numFood == 0 and not state.data._lose:
                 state.data.scoreChange += 500
                 state.data._win = True
         # Eat capsule
         if( position in state.getCapsules() ):
-            state.data.capsules.remove( position )
+            state.data.removeCapsule( position )
             state.data._capsuleEaten = position
             # Reset all ghosts' scared timers
             for index in range( 1, len( state.data.agentStates ) ):
-                state.data.agentStates[index].scaredTimer = SCARED_TIME
+                state.data.getAgentStateForUpdate( index ).scaredTimer = SCARED_TIME
     consume = staticmethod( consume )
 
 class GhostRules:
@@ -404,32 +490,32 @@ class GhostRules:
         reach a dead end, but can turn 90 degrees at intersections.
         """
         conf = state.getGhostState( ghostIndex ).configuration
-        possibleActions = Actions.getPossibleActions( conf, state.data.layout.walls )
-        reverse = Actions.reverseDirection( conf.direction )
-        if Directions.STOP in possibleActions:
-            possibleActions.remove( Directions.STOP )
-        if reverse in possibleActions and len( possibleActions ) > 1:
-            possibleActions.remove( reverse )
-        return possibleActions
+        return list( state.data.layout.getMoveTable().getGhostActions( conf ) )
     getLegalActions = staticmethod( getLegalActions )
 
     def applyAction( state, action, ghostIndex):
 
-        legal = GhostRules.getLegalActions( state, ghostIndex )
-        if action not in legal:
+        conf = state.getGhostState( ghostIndex ).configuration
+        moveTable = state.data.layout.getMoveTable()
+        if action not in moveTable.getGhostActions( conf ):
             raise Exception("Illegal ghost action " + str(action))
 
-        ghostState = state.data.agentStates[ghostIndex]
+        ghostState = state.data.getAgentStateForUpdate( ghostIndex )
         speed = GhostRules.GHOST_SPEED
         if ghostState.scaredTimer > 0: speed /= 2.0
-        vector = Actions.directionToVector( action, speed )
-        ghostState.configuration = ghostState.configuration.generateSuccessor( vector )
+        if speed == 1:
+            ghostState.configuration = moveTable.getSuccessor( ghostState.configuration, action )
+        else:
+            vector = Actions.directionToVector( action, speed )
+            ghostState.configuration = ghostState.configuration.generateSuccessor( vector )
     applyAction = staticmethod( applyAction )
 
     def decrementTimer( ghostState):
         timer = ghostState.scaredTimer
         if timer == 1:
-            ghostState.configuration.pos = nearestPoint( ghostState.configuration.pos )
+            # Configurations are shared between states, so replace it rather than snapping pos in place
+            conf = ghostState.configuration
+            ghostState.configuration = Configuration.intern( nearestPoint( conf.pos ), conf.direction )
         ghostState.scaredTimer = max( 0, timer - 1 )
     decrementTimer = staticmethod( decrementTimer )
 
@@ -450,11 +536,12 @@ class GhostRules:
 
     def collide( state, ghostState, agentIndex):
         if ghostState.scaredTimer > 0:
+            ghostState = state.data.getAgentStateForUpdate( agentIndex )
             state.data.scoreChange += 200
             GhostRules.placeGhost(state, ghostState)
             ghostState.scaredTimer = 0
             # Added for first-person
-            state.data._eaten[agentIndex] = True
+            state.data.getEatenForUpdate()[agentIndex] = True
         else:
             if not state.data._win:
                 state.data.scoreChange -= 500
@@ -527,7 +614,13 @@ def readCommand( argv ):
     parser.add_option('-r', '--recordActions', action='store_true', dest='record',
                       help='Writes game histories to a file (named by the time they were played)', default=False)
     parser.add_option('--replay', dest='gameToReplay',
-                      help='A recorded game file (pickle) to replay', default=None)
+                      help='A recorded game file to replay', default=None)
+    parser.add_option('--replayFrom', dest='replayFrom', type='int',
+                      help=default('The move to start the replay from'), default=0)
+    parser.add_option('--trajectories', dest='trajectories',
+                      help='Appends the actions and outcome of every game to a trajectory FILE', metavar='FILE', default=None)
+    parser.add_option('--compressTrajectories', action='store_true', dest='compressTrajectories',
+                      help='Compresses what --trajectories writes', default=False)
     parser.add_option('-a','--agentArgs',dest='agentArgs',
                       help='Comma separated values sent to agent. e.g. "opt1=val1,opt2,opt3=val3"')
     parser.add_option('-x', '--numTraining', dest='numTraining', type='int',
@@ -540,6 +633,8 @@ def readCommand( argv ):
                       help=default('Maximum length of time an agent can spend computing in a single game'), default=30)
     parser.add_option('-i', '--iterations', dest='iterations', type='int',
                       help=default('Maximum length of forward model steps'), default=500)
+    parser.add_option('-w', '--workers', dest='workers', type='int',
+                      help=default('Number of processes to play games in parallel (implies -q)'), default=1)
 
     options, otherjunk = parser.parse_args(argv)
     if len(otherjunk) != 0:
@@ -553,6 +648,9 @@ def readCommand( argv ):
     args['layout'] = layout.getLayout( options.layout )
     if args['layout'] == None: raise Exception("The layout " + options.layout + " cannot be found")
 
+    # Games played in worker processes are never displayed
+    if options.workers > 1: options.quietGraphics = True
+
     # Choose a Pacman agent
     noKeyboard = options.gameToReplay == None and (options.textGraphics or options.quietGraphics)
     pacmanType = loadAgent(options.pacman, noKeyboard)
@@ -587,20 +685,17 @@ def readCommand( argv ):
     args['record'] = options.record
     args['catchExceptions'] = options.catchExceptions
     args['timeout'] = options.timeout
-
-    Game.maxIterations = options.iterations
-    Game.currentIterations = Game.maxIterations
-    Game.timeLimit = options.timeout
+    args['workers'] = options.workers
+    args['maxIterations'] = options.iterations
+    if options.trajectories != None:
+        from trajectories import TrajectorySink
+        args['trajectories'] = TrajectorySink( options.trajectories, options.compressTrajectories )
 
     # Special case: recorded games don't use the runGames method or args structure
     if options.gameToReplay != None:
         print 'Replaying recorded game %s.' % options.gameToReplay
-        import cPickle
-        f = open(options.gameToReplay)
-        try: recorded = cPickle.load(f)
-        finally: f.close()
-        recorded['display'] = args['display']
-        replayGame(**recorded)
+        from gameRecord import GameRecord
+        replayGame( GameRecord.load( options.gameToReplay ), args['display'], options.replayFrom )
         sys.exit(0)
 
     return args
@@ -628,15 +723,18 @@ def loadAgent(pacman, nographics):
                 return getattr(module, pacman)
     raise Exception('The agent ' + pacman + ' is not specified in any *Agents.py.')
 
-def replayGame( layout, actions, display ):
+def replayGame( record, display, start=0 ):
+    """
+    Shows the moves of a gameRecord.GameRecord from move start onwards.
+    """
     import pacmanAgents, ghostAgents
     rules = ClassicGameRules()
-    agents = [pacmanAgents.GreedyAgent()] + [ghostAgents.RandomGhost(i+1) for i in range(layout.getNumGhosts()-1)] + [ghostAgents.DirectionalGhost(layout.getNumGhosts()+1)]
-    game = rules.newGame( layout, agents[0], agents[1:], display )
-    state = game.state
+    agents = [pacmanAgents.RandomAgent()] + [ghostAgents.RandomGhost(i+1) for i in range(record.numAgents - 1)]
+    game = rules.newGame( record.layout, agents[0], agents[1:], display )
+    state = game.state = record.stateAt( start, game.context )
     display.initialize(state.data)
 
-    for action in actions:
+    for action in record.getMoves( start ):
             # Execute the action
         state = state.generateSuccessor( *action )
         # Change the display
@@ -646,14 +744,26 @@ def replayGame( layout, actions, display ):
 
     display.finish()
 
-def runGames( layout, pacman, ghosts, display, numGames, record=False, numTraining = 0, catchExceptions=False, timeout=30 ):
+def runGames( layout, pacman, ghosts, display, numGames, record=False, numTraining = 0, catchExceptions=False, timeout=30, workers=1, trajectories=None, maxIterations=Game.maxIterations ):
+    """
+    Plays numGames games.  Every game is seeded from the parent's random
+    generator, as in runGamesInParallel, so the same games are played with
+    or without a trajectories.TrajectorySink, which each game is added to.
+    Each game gets its own GameContext with a budget of maxIterations
+    forward-model calls per move and timeout seconds.
+    """
+    if workers > 1:
+        return runGamesInParallel( layout, pacman, ghosts, numGames, workers, record, numTraining, catchExceptions, timeout, trajectories, maxIterations )
+
     import __main__
     __main__.__dict__['_display'] = display
 
     rules = ClassicGameRules(timeout)
     games = []
+    seeds = [random.randint(0, sys.maxint) for i in range( numGames )]
 
     for i in range( numGames ):
+        random.seed( seeds[i] )
         beQuiet = i < numTraining
         if beQuiet:
                 # Suppress output and graphics
@@ -663,29 +773,114 @@ def runGames( layout, pacman, ghosts, display, numGames, record=False, numTraini
         else:
             gameDisplay = display
             rules.quiet = False
-        game = rules.newGame( layout, pacman, ghosts, gameDisplay, beQuiet, catchExceptions)
+        game = rules.newGame( layout, pacman, ghosts, gameDisplay, beQuiet, catchExceptions, GameContext( maxIterations, timeout ) )
+        if record: recordGame( game, i )
         game.run()
+        if record: game.recorder.close()
         if not beQuiet: games.append(game)
+        if trajectories is not None:
+            trajectories.add( seeds[i], layout.name, pacmanActions( game ), game.state.getScore(), game.state.isWin() )
 
-        if record:
-            import time, cPickle
-            fname = ('recorded-game-%d' % (i + 1)) +  '-'.join([str(t) for t in time.localtime()[1:6]])
-            f = file(fname, 'w')
-            components = {'layout': layout, 'actions': game.moveHistory}
-            cPickle.dump(components, f)
-            f.close()
+    if trajectories is not None: trajectories.close()
 
     if (numGames-numTraining) > 0:
         scores = [game.state.getScore() for game in games]
         wins = [game.state.isWin() for game in games]
-        winRate = wins.count(True)/ float(len(wins))
-        print 'Average Score:', sum(scores) / float(len(scores))
-        print 'Scores:       ', ', '.join([str(score) for score in scores])
-        print 'Win Rate:      %d/%d (%.2f)' % (wins.count(True), len(wins), winRate)
-        print 'Record:       ', ', '.join([ ['Loss', 'Win'][int(w)] for w in wins])
+        printSummary(scores, wins)
 
     return games
 
+def recordGame( game, i ):
+    """
+    Streams the moves game is about to play to a file named by the time it
+    starts (see gameRecord.py).  The caller closes game.recorder.
+    """
+    import time
+    from gameRecord import RecordWriter
+    fname = ('recorded-game-%d' % (i + 1)) +  '-'.join([str(t) for t in time.localtime()[1:6]])
+    game.recorder = RecordWriter( open(fname, 'wb'), game.state )
+
+def pacmanActions( game ):
+    """
+    The codec.DIRECTION_CODES of the actions Pacman played in game.
+    """
+    from codec import DIRECTION_CODES
+    from array import array
+    return array( 'B', [DIRECTION_CODES[action] for agentIndex, action in game.moveHistory if agentIndex == 0] )
+
+class GameResult:
+    """
+    The outcome of one game, small enough to send back from a worker process.
+    """
+    def __init__( self, score, win, numMoves, agentTime, forwardModelCalls, seed=0, actions=None ):
+        self.score = score
+        self.win = win
+        self.numMoves = numMoves
+        self.agentTime = agentTime
+        self.forwardModelCalls = forwardModelCalls
+        self.seed = seed
+        self.actions = actions
+
+    def fromGame( game, seed=0 ):
+        actions = pacmanActions( game )
+        return GameResult( game.state.getScore(), game.state.isWin(), len(actions),
+                           game.totalAgentTimes[0], game.forwardModelCalls, seed, actions )
+    fromGame = staticmethod( fromGame )
+
+def runGamesInParallel( layout, pacman, ghosts, numGames, workers, record=False, numTraining = 0, catchExceptions=False, timeout=30, trajectories=None, maxIterations=Game.maxIterations ):
+    """
+    Plays numGames quiet games on a pool of worker processes.  Every game is
+    seeded from the parent's random generator, so a run is reproducible with
+    -f whatever the number of workers.  Returns a GameResult per game.
+    """
+    import multiprocessing
+    seeds = [random.randint(0, sys.maxint) for i in range( numGames )]
+    settings = (layout, pacman, ghosts, record, catchExceptions, timeout, maxIterations)
+    pool = multiprocessing.Pool( workers, _initGameWorker, settings )
+    try:
+        # map_async().get() with a timeout keeps Ctrl-C working in the parent
+        results = pool.map_async( _playWorkerGame, list(enumerate(seeds)), chunksize=1 ).get( sys.maxint )
+    finally:
+        pool.terminate()
+        pool.join()
+
+    if trajectories is not None:
+        for result in results:
+            trajectories.add( result.seed, layout.name, result.actions, result.score, result.win )
+        trajectories.close()
+    results = results[numTraining:]
+    if len(results) > 0:
+        printSummary( [r.score for r in results], [r.win for r in results] )
+        print 'Average Moves:', sum([r.numMoves for r in results]) / float(len(results))
+        print 'Agent Time:    %.2fs per game' % (sum([r.agentTime for r in results]) / len(results))
+        print 'Forward Model: %.1f calls per game' % (sum([r.forwardModelCalls for r in results]) / float(len(results)))
+    return results
+
+_workerSettings = None
+
+def _initGameWorker( *settings ):
+    global _workerSettings
+    _workerSettings = settings
+
+def _playWorkerGame( task ):
+    import textDisplay
+    i, seed = task
+    layout, pacman, ghosts, record, catchExceptions, timeout, maxIterations = _workerSettings
+    random.seed( seed )
+    rules = ClassicGameRules( timeout )
+    game = rules.newGame( layout, pacman, ghosts, textDisplay.NullGraphics(), True, catchExceptions, GameContext( maxIterations, timeout ) )
+    if record: recordGame( game, i )
+    game.run()
+    if record: game.recorder.close()
+    return GameResult.fromGame( game, seed )
+
+def printSummary( scores, wins ):
+    winRate = wins.count(True)/ float(len(wins))
+    print 'Average Score:', sum(scores) / float(len(scores))
+    print 'Scores:       ', ', '.join([str(score) for score in scores])
+    print 'Win Rate:      %d/%d (%.2f)' % (wins.count(True), len(wins), winRate)
+    print 'Record:       ', ', '.join([ ['Loss', 'Win'][int(w)] for w in wins])
+
 if __name__ == '__main__':
     """
     The main function called when pacman.py is run
@@ -15,9 +15,17 @@
 from pacman import Directions
 from game import Agent
 from heuristics import *
+from search import SearchEngine
+from search import TranspositionTable
+from search import MonteCarloTreeSearch
+from search import mergeStatistics
+from search import rootParallelSearch
+import atexit
+import heuristics
+import multiprocessing
 import random
-
-MAX_VALUE = 100000000
+import sys
+import time
 
 class RandomAgent(Agent):
     # Initialization Function: Called one time when the game starts
@@ -42,7 +50,7 @@ class OneStepLookAheadAgent(Agent):
         # get all legal actions for pacman
         legal = state.getLegalPacmanActions()
         # get all the successor state for these actions
-        successors = [(state.generatePacmanSuccessor(action), action) for action in legal]
+        successors = zip(state.generatePacmanSuccessors(legal), legal)
         # evaluate the successor states using scoreEvaluation heuristic
         scored = [(admissibleHeuristic(state), action) for state, action in successors]
         # get best choice
@@ -53,150 +61,179 @@ class OneStepLookAheadAgent(Agent):
         return random.choice(bestActions)
 
 
-class BFSAgent(Agent):
-    # Initialization Function: Called one time when the game starts
-    def registerInitialState(self, state):
-        return
+class SearchAgent(Agent):
+    """
+    Base class of the tree-search agents, which run a search.SearchEngine
+    from every state they are asked to move in.  Agent options (-a):
+
+      frontier      'fifo', 'lifo', 'priority' or 'beam' (see search.py)
+      heuristic     name of the cost-to-go function in heuristics.py
+      frontierSize  capacity of a priority frontier, width of a beam; 0
+                    (default) leaves the frontier unbounded
+      maxNodes      children one search may generate; 0 (default) searches
+                    until the forward-model budget runs out
+      tableSize     entries in the transposition table; 0 (default) disables it
+      tablePolicy   'lru' or 'depth' replacement when the table is full
+      keepTable     1 to keep the table across the moves of one game
+      moveTime      seconds a move may take at most; 0 (default) only keeps to
+                    the time the game allows (see setTimeLeft)
+      reuseTree     1 to go on from the last move's tree when the new state
+                    is in the part of it under the move made
+      stats         1 to write the table and tree reuse counters to stderr
+                    at the end of each game
+
+    With a table, a state reached again at the same or a greater depth of
+    the same search is not expanded twice.  Once a search ends, each
+    expanded state records the best cost-to-go found beneath it and how
+    deep beneath it the search went.  With keepTable, a later search takes
+    that value instead of expanding the state again, provided it was
+    explored about as deep as the new search is likely to reach.
+    """
+    def __init__(self, index=0, frontier='fifo', heuristic='admissibleHeuristic', frontierSize=0,
+                 maxNodes=0, tableSize=0, tablePolicy='lru', keepTable=0, moveTime=0, reuseTree=0, stats=0):
+        Agent.__init__(self, index)
+        self.moveTime = float(moveTime)
+        self.stats = bool(int(stats))
+        self.timeLeft = None
+        table = None
+        if int(tableSize) > 0:
+            table = TranspositionTable(int(tableSize), tablePolicy)
+        self.engine = SearchEngine(frontier, getattr(heuristics, heuristic), int(frontierSize),
+                                   int(maxNodes), table, bool(int(keepTable)), bool(int(reuseTree)))
 
-    # GetAction Function: Called with every frame
-    def getAction(self, state):
-        root = StateNode(state, 0)
-        queue = [(root, None)]
-        minCost = MAX_VALUE
-        bestAction = Directions.STOP
-        while len(queue) > 0:
-            size = len(queue)
-            for i in range(0, size):
-                curNode, curAction = queue.pop(0)
-                curState = curNode.state
-                if curNode != root and minCost > curNode.stepCost + admissibleHeuristic(curState):
-                    minCost = curNode.stepCost + admissibleHeuristic(curState)
-                    bestAction = curAction
-                if not curState.isWin() and not curState.isLose():
-                    legal = curState.getLegalPacmanActions()
-                    successors = [(curState.generatePacmanSuccessor(action), action) for action in legal]
-                    for successor in successors:
-                        if successor[0] is not None and successor[0]:
-                            queue.append((StateNode(successor[0], curNode.stepCost + 1),
-                                          curAction if curAction is not None else successor[1]))
-        return bestAction
-
-
-class DFSAgent(Agent):
     # Initialization Function: Called one time when the game starts
     def registerInitialState(self, state):
-        return
+        self.engine.reset()
+        self.engine.resetCounters()
+
+    def setTimeLeft(self, seconds):
+        self.timeLeft = seconds
 
     # GetAction Function: Called with every frame
     def getAction(self, state):
-        root = StateNode(state, 0)
-        stack = [(root, None)]
-        minCost = MAX_VALUE
-        bestAction = Directions.STOP
-        while len(stack) > 0:
-            curNode, curAction = stack.pop()
-            curState = curNode.state
-            # if curState not in visited:
-            if curNode != root and minCost > curNode.stepCost + admissibleHeuristic(curState):
-                minCost = curNode.stepCost + admissibleHeuristic(curState)
-                bestAction = curAction
-            if not curState.isWin() and not curState.isLose():
-                legal = curState.getLegalPacmanActions()
-                successors = [(curState.generatePacmanSuccessor(action), action) for action in legal]
-                for successor in successors:
-                    if successor[0] is not None and successor[0]:
-                        stack.append((StateNode(successor[0], curNode.stepCost + 1),
-                                      curAction if curAction is not None else successor[1]))
-        return bestAction
-
-
-class AStarAgent(Agent):
+        startTime = time.time()
+        timeLeft = self.timeLeft
+        if self.moveTime > 0 and (timeLeft is None or self.moveTime < timeLeft):
+            timeLeft = self.moveTime
+        self.timeLeft = None
+        if timeLeft is None:
+            return self.engine.search(state)
+        return self.engine.search(state, startTime + timeLeft)
+
+    def final(self, state):
+        engine = self.engine
+        if not self.stats: return
+        if engine.table is not None:
+            print >>sys.stderr, 'Transposition table: %d lookups, %d hits (%.1f%%), %d entries' % \
+                (engine.table.lookups, engine.table.hits, 100 * engine.table.hitRate(), len(engine.table))
+        if engine.reuseTree:
+            print >>sys.stderr, 'Tree reuse: %d of %d moves, %.1f nodes reused per move' % \
+                (engine.reuses, engine.searches, engine.reused / float(max(1, engine.searches)))
+
+
+def fixedFrontier(agent, frontier, options):
+    """
+    The options of a SearchAgent subclass that always searches with frontier.
+    """
+    if 'frontier' in options:
+        raise Exception('%s always uses the %s frontier; run SearchAgent to choose one' % (agent.__class__.__name__, frontier))
+    options['frontier'] = frontier
+    return options
+
+
+class BFSAgent(SearchAgent):
+    def __init__(self, index=0, **options):
+        SearchAgent.__init__(self, index, **fixedFrontier(self, 'fifo', options))
+
+
+class DFSAgent(SearchAgent):
+    def __init__(self, index=0, **options):
+        SearchAgent.__init__(self, index, **fixedFrontier(self, 'lifo', options))
+
+
+class AStarAgent(SearchAgent):
+    def __init__(self, index=0, **options):
+        SearchAgent.__init__(self, index, **fixedFrontier(self, 'priority', options))
+
+
+class MCTSAgent(Agent):
+    """
+    Monte Carlo tree search (see search.MonteCarloTreeSearch).  Agent
+    options (-a):
+
+      rolloutDepth  random moves played out from each new node (default 10)
+      exploration   the UCB1 exploration constant (default 1)
+      maxRollouts   rollouts per move; 0 (default) plays until the
+                    forward-model budget or the time runs out
+      moveTime      seconds a move may take at most; 0 (default) only keeps to
+                    the time the game allows
+      workers       processes running independent searches from the same
+                    state, whose root statistics are merged (default 1)
+
+    The workers split the forward-model budget of the move between them,
+    and what they spend is charged to the game's GameContext.  Their pool is
+    closed by final(), or at exit if the game ends without it.
+    """
+    def __init__(self, index=0, rolloutDepth=10, exploration=1.0, maxRollouts=0, moveTime=0, workers=1):
+        Agent.__init__(self, index)
+        self.mcts = MonteCarloTreeSearch(int(rolloutDepth), float(exploration), int(maxRollouts))
+        self.moveTime = float(moveTime)
+        self.workers = int(workers)
+        self.timeLeft = None
+        self.pool = None
+        self.inWorker = False
+        self.closeAtExit = False
+
     # Initialization Function: Called one time when the game starts
     def registerInitialState(self, state):
-        return
+        if self.workers > 1 and self.pool is None and not self.inWorker:
+            if multiprocessing.current_process().daemon:
+                # Games already played in a pool (pacman.py -w) cannot start their own
+                print >>sys.stderr, 'MCTSAgent: running the %d searches of a move in turn inside a worker' % self.workers
+                self.inWorker = True
+            else:
+                self.pool = multiprocessing.Pool(self.workers)
+                if not self.closeAtExit:
+                    atexit.register(self.closePool)
+                    self.closeAtExit = True
+
+    def setTimeLeft(self, seconds):
+        self.timeLeft = seconds
 
     # GetAction Function: Called with every frame
     def getAction(self, state):
-        root = StateNode(state, 0)
-        pq = PriorityQueue()
-        pq.put((admissibleHeuristic(state), root, None))
-        minCost = MAX_VALUE
-        bestAction = Directions.STOP
-        while pq.size() > 0:
-            _, curNode, curAction = pq.get()
-            curState = curNode.state
-            if curNode != root and minCost > curNode.stepCost + admissibleHeuristic(curState):
-                minCost = curNode.stepCost + admissibleHeuristic(curState)
-                bestAction = curAction
-            if not curState.isWin() and not curState.isLose():
-                legal = curState.getLegalPacmanActions()
-                successors = [(curState.generatePacmanSuccessor(action), action) for action in legal]
-                for successor in successors:
-                    if successor[0] is not None and successor[0]:
-                        pq.put((curNode.stepCost + 1 + admissibleHeuristic(successor[0]),
-                                StateNode(successor[0], curNode.stepCost + 1),
-                                curAction if curAction is not None else successor[1]))
-        return bestAction
-
-class StateNode:
-    def __init__(self, state, stepCost):
-        self.state = state
-        self.stepCost = stepCost
-
-
-# input (totalCost, node, action)
-class PriorityQueue(object):
-    def __init__(self):
-        self.data_list = [(None, None, None)]
-
-    def size(self):
-        return len(self.data_list) - 1
-
-    def left_child(self, root):
-        return root * 2
-
-    def right_child(self, root):
-        return root * 2 + 1
-
-    def father(self, node):
-        return node / 2
-
-    def heapify(self, root):
-        if root > self.size():
-            return
-        left_node = self.left_child(root)
-        right_node = self.right_child(root)
-        smallest = root
-        if left_node <= self.size():
-            if self.data_list[left_node][0] < self.data_list[smallest][0]:
-                smallest = left_node
-
-        if right_node <= self.size():
-            if self.data_list[right_node][0] < self.data_list[smallest][0]:
-                smallest = right_node
-
-        if smallest != root:
-            self.data_list[root], self.data_list[smallest] = self.data_list[smallest], self.data_list[root]
-            self.heapify(smallest)
-
-    def build_heap(self):
-        for i in range(self.size() / 2, 0, -1):
-            self.heapify(i)
-
-    def get(self):
-        if self.size() < 1:
-            return None
-        ret = self.data_list[1]
-        self.data_list[1] = self.data_list[-1]
-        del self.data_list[-1]
-        self.heapify(1)
-        return ret
-
-    def put(self, data):
-        self.data_list.append(data)
-        now_index = self.size()
-        pre = self.father(now_index)
-        while now_index > 1 and self.data_list[pre][0] > data[0]:
-            self.data_list[pre], self.data_list[now_index] = self.data_list[now_index], self.data_list[pre]
-            now_index = pre
-            pre = now_index / 2
+        startTime = time.time()
+        timeLeft = self.timeLeft
+        if self.moveTime > 0 and (timeLeft is None or self.moveTime < timeLeft):
+            timeLeft = self.moveTime
+        self.timeLeft = None
+        deadline = None
+        if timeLeft is not None:
+            deadline = startTime + timeLeft
+        if self.workers <= 1:
+            root = self.mcts.search(state, deadline)
+            return MonteCarloTreeSearch.bestAction(MonteCarloTreeSearch.rootStatistics(root))
+
+        context = state.getContext()
+        budget = max(1, context.currentIterations // self.workers)
+        mcts = self.mcts
+        state = state.deepCopy()
+        tasks = [(state, budget, deadline, random.getrandbits(32), mcts.rolloutDepth, mcts.exploration, mcts.maxRollouts)
+                 for i in range(self.workers)]
+        if self.pool is not None:
+            results = self.pool.map_async(rootParallelSearch, tasks).get(sys.maxint)
+        else:
+            results = [rootParallelSearch(task) for task in tasks]
+        context.spend(sum([used for statistics, used, rollouts in results]))
+        mcts.searches += 1
+        mcts.rollouts += sum([rollouts for statistics, used, rollouts in results])
+        return MonteCarloTreeSearch.bestAction(mergeStatistics([statistics for statistics, used, rollouts in results]))
+
+    def closePool(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+    def final(self, state):
+        self.closePool()
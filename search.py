@@ -0,0 +1,704 @@
+# search.py
+# ---------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+The tree search shared by the search agents in pacmanAgents.py.
+
+A SearchEngine expands pacman's moves from a state with
+GameState.generatePacmanSuccessors, so every child it generates is paid for
+out of the forward-model budget of the state's GameContext, and returns the first action of
+the best node it reached.  What order nodes are expanded in is up to the
+frontier it is given:
+
+  fifo      breadth first, on a deque
+  lifo      depth first, on a list
+  priority  best first by stepCost + heuristic (A*), on PriorityQueue
+  beam      breadth first, keeping the frontierSize best nodes of each depth
+
+A new strategy is a class with push, pop and __len__ added to FRONTIERS.
+
+MonteCarloTreeSearch is the sampling alternative: UCT over pacman's moves,
+using generatePacmanSuccessor, which moves the ghosts at random, as its
+simulator.
+"""
+
+from game import GameContext
+from game import Directions
+from heuristics import admissibleHeuristic
+from heuristics import normalizedScoreEvaluation
+import collections
+import heapq
+import itertools
+import math
+import random
+import time
+
+MAX_VALUE = 100000000
+
+class SearchEngine:
+    """
+    Runs searches with one frontier strategy and heuristic.
+
+      frontier      a key of FRONTIERS
+      heuristic     the estimated cost-to-go of a state
+      frontierSize  passed to the frontier: a capacity for 'priority', the
+                    beam width for 'beam'; 0 leaves the frontier unbounded
+      maxNodes      children one search may generate; 0 only stops at the
+                    end of the forward-model budget
+      table         an optional TranspositionTable
+      keepTable     keep the table from one search to the next
+      reuseTree     keep the subtree under the chosen action; a search from
+                    a state found in it by hash goes on from that node
+                    instead of starting over (not with a table)
+
+    The counters searches, expanded, generated, skipped (children already
+    reached as cheaply), maxFrontier, timeouts (searches cut short by their
+    deadline), reuses (searches that started from a kept node) and reused
+    (kept nodes they took over) add up over searches until resetCounters().
+    """
+    def __init__(self, frontier='fifo', heuristic=admissibleHeuristic, frontierSize=0,
+                 maxNodes=0, table=None, keepTable=False, reuseTree=False):
+        if frontier not in FRONTIERS:
+            raise Exception('Unknown frontier ' + str(frontier))
+        if reuseTree and table is not None:
+            raise Exception('Search trees cannot be reused together with a transposition table')
+        self.frontierType = FRONTIERS[frontier]
+        self.heuristic = heuristic
+        self.frontierSize = frontierSize
+        self.maxNodes = maxNodes
+        self.table = table
+        self.keepTable = keepTable
+        self.reuseTree = reuseTree
+        self.retained = None
+        self.searchNumber = 0
+        self.nodes = []
+        self.horizon = 0
+        self.resetCounters()
+
+    def resetCounters(self):
+        self.searches = 0
+        self.expanded = 0
+        self.generated = 0
+        self.skipped = 0
+        self.maxFrontier = 0
+        self.timeouts = 0
+        self.reuses = 0
+        self.reused = 0
+
+    def reset(self):
+        """
+        Forgets what earlier searches learnt; called at the start of a game.
+        """
+        if self.table is not None:
+            self.table.clear()
+            self.table.resetStats()
+        self.horizon = 0
+        self.retained = None
+
+    def search(self, state, deadline=None):
+        """
+        Searches from state and returns the first action towards the node
+        with the lowest stepCost + heuristic, or STOP if none was reached.
+
+        The best node so far is kept up to date as nodes come off the
+        frontier, so the search is anytime: given a deadline (a time.time()
+        value) it stops expanding when the deadline passes and answers with
+        what it has, though never before it has expanded the root.
+        """
+        context = state.getContext()
+        root = self.startSearch(state)
+        frontier = self.frontierType(self.frontierSize)
+        usesPriority = frontier.usesPriority
+        minCost, bestAction = self.seedFrontier(root, frontier)
+        generated = 0
+        expanded = 0
+        while len(frontier) > 0:
+            node, action = frontier.pop()
+            if node is not root:
+                cost = self.evaluate(node)
+                if minCost > cost:
+                    minCost = cost
+                    bestAction = action
+            if deadline is not None and expanded and time.time() >= deadline:
+                self.timeouts += 1
+                break
+            # Once the budget is spent generatePacmanSuccessors returns no
+            # more children, so the rest of the frontier is only scored
+            if not self.canExpand(node) or context.currentIterations <= 1:
+                continue
+            legal = node.state.getLegalPacmanActions()
+            if self.maxNodes:
+                if generated >= self.maxNodes: continue
+                legal = legal[:self.maxNodes - generated]
+            node.expanded = True
+            expanded += 1
+            if self.reuseTree:
+                node.children = []
+            for child, childAction in zip(node.state.generatePacmanSuccessors(legal), legal):
+                if child is None: continue
+                generated += 1
+                childNode = self.newNode(child, node)
+                if childNode is None or not frontier.push((childNode, action if action is not None else childAction),
+                                                          usesPriority and self.evaluate(childNode), hash(child)):
+                    self.skipped += 1
+                elif self.reuseTree:
+                    node.children.append((childAction, childNode))
+            if len(frontier) > self.maxFrontier:
+                self.maxFrontier = len(frontier)
+        self.expanded += expanded
+        self.generated += generated
+        self.finishSearch()
+        if self.reuseTree:
+            self.retain(root, bestAction)
+        return bestAction
+
+    def startSearch(self, state):
+        """
+        Returns the root node of a new search from state: the node kept from
+        the last search for state, if there is one.
+        """
+        self.searches += 1
+        self.searchNumber += 1
+        self.nodes = []
+        if self.table is not None and not self.keepTable:
+            self.table.clear()
+        if self.retained:
+            node = self.retained.get(hash(state))
+            self.retained = None
+            if node is not None and node.state == state:
+                self.reuses += 1
+                return node
+        return self.newNode(state, None)
+
+    def seedFrontier(self, root, frontier):
+        """
+        Puts root on the frontier.  For a node kept from the last search,
+        its expanded descendants are scored as if they had just come off the
+        frontier and its unexpanded ones are put back on it instead, breadth
+        first so that a fifo frontier stays in depth order.  Returns the
+        lowest cost scored and the first action towards it.
+        """
+        minCost = MAX_VALUE
+        bestAction = Directions.STOP
+        usesPriority = frontier.usesPriority
+        root.stepCost = 0
+        layer = [(root, None)]
+        while layer:
+            nextLayer = []
+            for node, action in layer:
+                if not node.expanded:
+                    frontier.push((node, action), usesPriority and self.evaluate(node), hash(node.state))
+                    continue
+                if node is not root:
+                    cost = self.evaluate(node)
+                    if minCost > cost:
+                        minCost = cost
+                        bestAction = action
+                for childAction, child in node.children:
+                    child.stepCost = node.stepCost + 1
+                    nextLayer.append((child, action if action is not None else childAction))
+            self.reused += len(nextLayer)
+            layer = nextLayer
+        return minCost, bestAction
+
+    def retain(self, root, action):
+        """
+        Keeps the subtree under action, indexed by state hash, for the next
+        search to start from.
+        """
+        retained = {}
+        layer = [child for childAction, child in root.children or [] if childAction == action]
+        while layer:
+            nextLayer = []
+            for node in layer:
+                key = hash(node.state)
+                if key not in retained: retained[key] = node
+                if node.children: nextLayer.extend([child for childAction, child in node.children])
+            layer = nextLayer
+        self.retained = retained
+
+    def newNode(self, state, parent):
+        """
+        Returns a StateNode for state reached from parent, or None if the
+        transposition table says it has already been reached as cheaply.
+        """
+        if parent is None:
+            node = StateNode(state, 0)
+        else:
+            node = StateNode(state, parent.stepCost + 1)
+        if self.table is None:
+            return node
+        skip, value, height = self.table.visit(hash(state), self.searchNumber, node.stepCost)
+        if skip:
+            return None
+        node.parent = parent
+        node.known = value is not None and height >= self.horizon - node.stepCost
+        if node.known:
+            node.value = value
+            node.height = height
+        else:
+            node.value = self.heuristic(state)
+            node.height = 0
+        self.nodes.append(node)
+        return node
+
+    def evaluate(self, node):
+        """
+        The estimated total cost of the best plan through node.
+        """
+        if self.table is not None and node.known:
+            return node.stepCost + node.value
+        return node.stepCost + self.heuristic(node.state)
+
+    def canExpand(self, node):
+        curState = node.state
+        if curState.isWin() or curState.isLose():
+            return False
+        return self.table is None or not node.known
+
+    def finishSearch(self):
+        """
+        Backs the best cost-to-go found under each node up to its parent and
+        stores the values of the expanded nodes in the transposition table.
+        """
+        if self.table is None: return
+        for node in reversed(self.nodes):
+            parent = node.parent
+            if parent is not None:
+                parent.value = min(parent.value, node.value + 1)
+                parent.height = max(parent.height, node.height + 1)
+        for node in self.nodes:
+            if node.expanded:
+                self.table.storeValue(hash(node.state), self.searchNumber, node.value, node.height)
+        self.horizon = self.nodes[0].height
+        self.nodes = []
+
+
+class FifoFrontier:
+    usesPriority = False
+
+    def __init__(self, size=0):
+        self.items = collections.deque()
+
+    def push(self, item, priority, key):
+        self.items.append(item)
+        return True
+
+    def pop(self):
+        return self.items.popleft()
+
+    def __len__(self):
+        return len(self.items)
+
+
+class LifoFrontier:
+    usesPriority = False
+
+    def __init__(self, size=0):
+        self.items = []
+
+    def push(self, item, priority, key):
+        self.items.append(item)
+        return True
+
+    def pop(self):
+        return self.items.pop()
+
+    def __len__(self):
+        return len(self.items)
+
+
+class PriorityFrontier:
+    """
+    Best first on a PriorityQueue keyed by state hash, so a state is queued
+    once, at the lowest priority it was reached with.
+    """
+    usesPriority = True
+
+    def __init__(self, size=0):
+        self.queue = PriorityQueue(size or None)
+
+    def push(self, item, priority, key):
+        return self.queue.put(item, priority, key)
+
+    def pop(self):
+        return self.queue.get()
+
+    def __len__(self):
+        return self.queue.size()
+
+
+class BeamFrontier:
+    """
+    Breadth first, but of the children of each depth only the size with the
+    lowest priority (ties in the order they were pushed) are expanded.
+    """
+    usesPriority = True
+
+    def __init__(self, size=0):
+        self.size = size
+        self.current = collections.deque()
+        self.next = []
+        self.counter = itertools.count()
+
+    def push(self, item, priority, key):
+        self.next.append((priority, next(self.counter), item))
+        return True
+
+    def pop(self):
+        if not self.current:
+            layer = self.next
+            if self.size:
+                layer = heapq.nsmallest(self.size, layer)
+            self.current.extend([item for priority, count, item in layer])
+            self.next = []
+        return self.current.popleft()
+
+    def __len__(self):
+        return len(self.current) + len(self.next)
+
+
+FRONTIERS = {
+    'fifo': FifoFrontier,
+    'lifo': LifoFrontier,
+    'priority': PriorityFrontier,
+    'beam': BeamFrontier,
+}
+
+class StateNode(object):
+    __slots__ = ('state', 'stepCost', 'expanded', 'parent', 'known', 'value', 'height', 'children')
+
+    def __init__(self, state, stepCost):
+        self.state = state
+        self.stepCost = stepCost
+        self.expanded = False
+        self.parent = None
+        self.known = False
+        self.value = 0
+        self.height = 0
+        self.children = None
+
+
+class PriorityQueue(object):
+    """
+    A min-priority frontier on heapq.  Items of equal priority come out in
+    the order they were put in.
+
+    An item put with a key (the search agents use the state hash) replaces
+    a queued item with the same key if its priority is lower and is dropped
+    otherwise; the replaced entry stays in the heap, marked removed, until
+    get() pops it.  With a capacity, whenever a put makes the queue hold
+    more than capacity items it is cut back to its best 3/4 * capacity.
+    """
+    def __init__(self, capacity=None):
+        self.heap = []
+        self.entries = {}
+        self.counter = itertools.count()
+        self.capacity = capacity
+        self.live = 0
+        self.dropped = 0
+
+    def size(self):
+        return self.live
+
+    def __len__(self):
+        return self.live
+
+    def put(self, item, priority, key=None):
+        """
+        Queues item; returns False if an item with the same key is already
+        queued at the same or a lower priority.
+        """
+        if key is not None:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if entry[0] <= priority:
+                    return False
+                entry[3] = False
+                self.live -= 1
+        entry = [priority, next(self.counter), item, True, key]
+        if key is not None:
+            self.entries[key] = entry
+        heapq.heappush(self.heap, entry)
+        self.live += 1
+        if self.capacity is not None and self.live > self.capacity:
+            self.shrink(self.capacity * 3 // 4)
+        return True
+
+    def get(self):
+        """
+        Removes and returns the item with the lowest priority, or None if
+        the queue is empty.
+        """
+        heap = self.heap
+        while heap:
+            priority, count, item, alive, key = heapq.heappop(heap)
+            if alive:
+                self.live -= 1
+                if key is not None:
+                    del self.entries[key]
+                return item
+        return None
+
+    def shrink(self, size):
+        """
+        Keeps only the size best items.
+        """
+        keep = heapq.nsmallest(size, [entry for entry in self.heap if entry[3]])
+        self.dropped += self.live - len(keep)
+        self.heap = keep
+        self.live = len(keep)
+        self.entries = dict([(entry[4], entry) for entry in keep if entry[4] is not None])
+
+class TranspositionTable:
+    """
+    A bounded map from state hashes to what the search agents know about
+    the state: the search and depth at which it was last reached and, once
+    that search has finished, the best cost-to-go found beneath it and the
+    height of the subtree that was explored to find it.
+
+    policy 'lru' evicts the least recently used entry when the table is
+    full.  policy 'depth' is a fixed array of size slots indexed by hash;
+    a new state takes over a slot unless the slot holds a state reached at
+    a lower depth in the current search.
+    """
+    def __init__(self, size, policy='lru'):
+        if policy not in ['lru', 'depth']:
+            raise Exception('Unknown transposition table policy ' + str(policy))
+        self.size = size
+        self.policy = policy
+        self.clear()
+        self.resetStats()
+
+    def clear(self):
+        if self.policy == 'lru':
+            self.entries = collections.OrderedDict()
+        else:
+            self.slots = [None] * self.size
+
+    def resetStats(self):
+        self.lookups = 0
+        self.hits = 0
+
+    def hitRate(self):
+        if self.lookups == 0: return 0.0
+        return self.hits / float(self.lookups)
+
+    def __len__(self):
+        if self.policy == 'lru':
+            return len(self.entries)
+        return self.size - self.slots.count(None)
+
+    def _get(self, key):
+        if self.policy == 'lru':
+            entry = self.entries.pop(key, None)
+            if entry is not None: self.entries[key] = entry
+            return entry
+        entry = self.slots[key % self.size]
+        if entry is not None and entry[0] == key:
+            return entry
+        return None
+
+    def _put(self, key, entry):
+        if self.policy == 'lru':
+            self.entries[key] = entry
+            if len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+            return
+        slot = key % self.size
+        old = self.slots[slot]
+        if old is None or old[0] == key or old[1] != entry[1] or entry[2] <= old[2]:
+            self.slots[slot] = entry
+
+    def visit(self, key, search, depth):
+        """
+        Looks up a state reached at depth in search number search.  Returns
+        (skip, value, height): skip is True if this search already reached
+        the state at that depth or less; value and height are what an
+        earlier search found beneath the state, or None if it has none.
+        """
+        self.lookups += 1
+        entry = self._get(key)
+        if entry is not None:
+            entryKey, entrySearch, entryDepth, value, height = entry
+            if entrySearch == search and entryDepth <= depth:
+                self.hits += 1
+                return True, None, None
+            if entrySearch != search and value is not None:
+                self.hits += 1
+                self._put(key, (key, search, depth, value, height))
+                return False, value, height
+        self._put(key, (key, search, depth, None, None))
+        return False, None, None
+
+    def storeValue(self, key, search, value, height):
+        entry = self._get(key)
+        if entry is not None and entry[1] == search:
+            self._put(key, (key, search, entry[2], value, height))
+
+
+class MCTSNode(object):
+    """
+    A node of the Monte Carlo tree: the state one sampled outcome of action
+    led to, and the visits and summed rollout values that went through it.
+    """
+    __slots__ = ('state', 'parent', 'action', 'children', 'untried', 'visits', 'value')
+
+    def __init__(self, state, parent, action):
+        self.state = state
+        self.parent = parent
+        self.action = action
+        self.children = []
+        if state.isWin() or state.isLose():
+            self.untried = []
+        else:
+            self.untried = state.getLegalPacmanActions()
+        self.visits = 0
+        self.value = 0.0
+
+
+class MonteCarloTreeSearch:
+    """
+    UCT search over pacman's moves.  Every iteration descends the tree by
+    UCB1 with the given exploration constant, expands one untried move of
+    the node it stops at, plays at most rolloutDepth random moves from there
+    and backs normalizedScoreEvaluation(root, end of rollout) up the path.
+
+    Each expansion and rollout move is one generatePacmanSuccessor call, so
+    a search ends when the budget of the state's GameContext runs out, when maxRollouts
+    rollouts have been played or when the deadline passes, whichever comes
+    first.  searches and rollouts count up until resetCounters().
+    """
+    def __init__(self, rolloutDepth=10, exploration=1.0, maxRollouts=0):
+        self.rolloutDepth = rolloutDepth
+        self.exploration = exploration
+        self.maxRollouts = maxRollouts
+        self.resetCounters()
+
+    def resetCounters(self):
+        self.searches = 0
+        self.rollouts = 0
+
+    def search(self, state, deadline=None):
+        """
+        Runs a search from state and returns its root MCTSNode.
+        """
+        self.searches += 1
+        root = MCTSNode(state, None, None)
+        rollouts = 0
+        # Rollouts from terminal nodes cost nothing, so also stop after as
+        # many rollouts as there were forward-model calls to spend
+        maxRollouts = max(0, state.getContext().currentIterations)
+        if self.maxRollouts: maxRollouts = min(maxRollouts, self.maxRollouts)
+        while rollouts < maxRollouts:
+            if deadline is not None and rollouts and time.time() >= deadline:
+                break
+            node = self.select(root)
+            if node.untried:
+                action = node.untried.pop(random.randint(0, len(node.untried) - 1))
+                successor = node.state.generatePacmanSuccessor(action)
+                if successor is None: break
+                child = MCTSNode(successor, node, action)
+                node.children.append(child)
+                node = child
+            value = normalizedScoreEvaluation(state, self.rollout(node.state))
+            rollouts += 1
+            while node is not None:
+                node.visits += 1
+                node.value += value
+                node = node.parent
+        self.rollouts += rollouts
+        return root
+
+    def select(self, node):
+        """
+        Follows the children with the highest UCB1 value down to a node with
+        an untried move or no children.
+        """
+        exploration = self.exploration
+        while not node.untried and node.children:
+            logVisits = math.log(node.visits)
+            best = None
+            bestValue = None
+            for child in node.children:
+                value = child.value / child.visits + exploration * math.sqrt(logVisits / child.visits)
+                if best is None or value > bestValue:
+                    best = child
+                    bestValue = value
+            node = best
+        return node
+
+    def rollout(self, state):
+        """
+        Plays up to rolloutDepth random pacman moves from state; returns the
+        last state reached.
+        """
+        for i in range(self.rolloutDepth):
+            if state.isWin() or state.isLose(): break
+            legal = state.getLegalPacmanActions()
+            successor = state.generatePacmanSuccessor(legal[random.randint(0, len(legal) - 1)])
+            if successor is None: break
+            state = successor
+        return state
+
+    def rootStatistics(root):
+        """
+        Returns {action: [visits, summed value]} for the children of root.
+        """
+        statistics = {}
+        for child in root.children:
+            statistics[child.action] = [child.visits, child.value]
+        return statistics
+    rootStatistics = staticmethod(rootStatistics)
+
+    def bestAction(statistics):
+        """
+        The most visited action in statistics (the best average value breaks
+        ties), or STOP if it is empty.
+        """
+        best = Directions.STOP
+        bestKey = None
+        for action in sorted(statistics.keys()):
+            visits, value = statistics[action]
+            key = (visits, value / max(1, visits))
+            if bestKey is None or key > bestKey:
+                best = action
+                bestKey = key
+        return best
+    bestAction = staticmethod(bestAction)
+
+def mergeStatistics(statisticsList):
+    """
+    Sums the root statistics of independent searches from the same state.
+    """
+    merged = {}
+    for statistics in statisticsList:
+        for action, (visits, value) in statistics.items():
+            total = merged.setdefault(action, [0, 0.0])
+            total[0] += visits
+            total[1] += value
+    return merged
+
+def rootParallelSearch(task):
+    """
+    Runs one search of a root-parallel MCTS in a worker process.  task is
+    (state, budget, deadline, seed, rolloutDepth, exploration, maxRollouts);
+    returns (root statistics, forward-model calls used, rollouts played).
+    """
+    state, budget, deadline, seed, rolloutDepth, exploration, maxRollouts = task
+    random.seed(seed)
+    context = GameContext(budget)
+    mcts = MonteCarloTreeSearch(rolloutDepth, exploration, maxRollouts)
+    root = mcts.search(state.withContext(context), deadline)
+    return MonteCarloTreeSearch.rootStatistics(root), budget - max(0, context.currentIterations), mcts.rollouts
@@ -0,0 +1,188 @@
+# tests.py
+# --------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+Round-trip checks for the engine's compact representations: BitGrid
+against Grid, incremental Zobrist hashes, the state codec, recorded games
+and trajectory files.
+
+> python tests.py
+"""
+
+from game import Grid, BitGrid, reconstituteGrid
+from gameRecord import RecordWriter, GameRecord
+from trajectories import TrajectorySink, TrajectoryReader
+from search import PriorityQueue
+from pacman import GameState
+import codec
+import layout
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+def playRandomGame(name, numMoves, seed, numGhosts=4):
+    """
+    The states of a game on layout name in which every agent moves at
+    random, starting with the initial state.
+    """
+    rng = random.Random(seed)
+    state = GameState()
+    state.initialize(layout.getLayout(name), numGhosts)
+    states = [state]
+    moves = []
+    while len(moves) < numMoves and not (state.isWin() or state.isLose()):
+        agentIndex = len(moves) % state.getNumAgents()
+        action = rng.choice(state.getLegalActions(agentIndex))
+        state = state.generateSuccessor(agentIndex, action)
+        states.append(state)
+        moves.append((agentIndex, action))
+    return states, moves
+
+def sameState(a, b):
+    return a == b and hash(a) == hash(b)
+
+class BitGridTest(unittest.TestCase):
+    def randomGrids(self):
+        rng = random.Random(1)
+        # 31 * 33 and 30 * 31 cells are whole multiples of CELLS_PER_INT
+        for width, height in [(1, 1), (3, 5), (20, 7), (31, 33), (30, 31), (28, 31)]:
+            grid, bitGrid = Grid(width, height), BitGrid(width, height)
+            for x in range(width):
+                for y in range(height):
+                    if rng.random() < 0.4:
+                        grid[x][y] = True
+                        bitGrid[x][y] = True
+            yield grid, bitGrid
+
+    def testPackBits(self):
+        for grid, bitGrid in self.randomGrids():
+            self.assertEqual(grid.packBits(), bitGrid.packBits())
+            self.assertEqual(BitGrid(grid.width, grid.height, bitRepresentation=grid.packBits()[2:]), bitGrid)
+            self.assertEqual(reconstituteGrid(bitGrid.packBits()), bitGrid)
+            unpacked = Grid(grid.width, grid.height, bitRepresentation=bitGrid.packBits()[2:])
+            self.assertEqual(unpacked.asList(), grid.asList())
+
+    def testAsListAndCount(self):
+        for grid, bitGrid in self.randomGrids():
+            self.assertEqual(sorted(bitGrid.asList()), sorted(grid.asList()))
+            self.assertEqual(sorted(bitGrid.asList(False)), sorted(grid.asList(False)))
+            self.assertEqual(bitGrid.count(), grid.count())
+            self.assertEqual(bitGrid.count(False), grid.count(False))
+
+class ZobristTest(unittest.TestCase):
+    def testIncrementalHash(self):
+        for name in ['smallClassic', 'mediumClassic', 'capsuleClassic']:
+            for seed in range(10):
+                for state in playRandomGame(name, 1000, seed, numGhosts=2)[0]:
+                    data = state.data.deepCopy()
+                    data._computeZobristHash()
+                    self.assertEqual(state.data.getZobristHash(), data.getZobristHash())
+
+class CodecTest(unittest.TestCase):
+    def testRoundTrip(self):
+        for name in ['mediumClassic', 'capsuleClassic']:
+            states = playRandomGame(name, 300, 2)[0]
+            for state in states:
+                self.assertTrue(sameState(codec.decode(codec.encode(state)), state))
+                self.assertEqual(codec.encode(codec.decode(codec.encode(state))), codec.encode(state))
+
+    def testAgentOffBoard(self):
+        state = playRandomGame('smallClassic', 20, 3)[0][-1].deepCopy()
+        state.data.getAgentStateForUpdate(state.getNumAgents() - 1).configuration = None
+        decoded = codec.decode(codec.encode(state))
+        self.assertEqual(decoded.data.agentStates[-1].configuration, None)
+        self.assertTrue(sameState(decoded, state))
+
+    def testUnknownFingerprint(self):
+        self.assertRaises(Exception, codec.findLayout, 123)
+
+class GameRecordTest(unittest.TestCase):
+    def record(self, states, moves, interval):
+        path = tempfile.mktemp()
+        try:
+            writer = RecordWriter(open(path, 'wb'), states[0], interval)
+            for (agentIndex, action), state in zip(moves, states[1:]):
+                writer.record(agentIndex, action, state)
+            writer.close()
+            return GameRecord.load(path)
+        finally:
+            if os.path.exists(path): os.remove(path)
+
+    def testStateAt(self):
+        states, moves = playRandomGame('mediumClassic', 250, 4)
+        for interval in [1, 7, 100]:
+            record = self.record(states, moves, interval)
+            self.assertEqual(record.numMoves, len(moves))
+            for n in range(len(states)):
+                self.assertTrue(sameState(record.stateAt(n), states[n]))
+
+    def testGetMoves(self):
+        states, moves = playRandomGame('smallClassic', 60, 5)
+        record = self.record(states, moves, 10)
+        for start in range(len(moves) + 1):
+            self.assertEqual(record.getMoves(start), moves[start:])
+        for n in [-1, len(moves) + 1]:
+            self.assertRaises(IndexError, record.getMoves, n)
+            self.assertRaises(IndexError, record.stateAt, n)
+
+class TrajectoriesTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def randomGames(self, count):
+        rng = random.Random(6)
+        games = []
+        for i in range(count):
+            actions = [rng.choice(codec.DIRECTIONS) for j in range(rng.randint(0, 40))]
+            games.append((rng.randint(0, 2 ** 63), rng.choice(['smallClassic', 'mediumClassic', '']),
+                          actions, float(rng.randint(-500, 2000)), rng.random() < 0.5))
+        return games
+
+    def checkRoundTrip(self, compress):
+        path = os.path.join(self.directory, 'games.ptb')
+        games = self.randomGames(25)
+        # Two sinks on one file: the second appends and numbers on
+        for batch in [games[:12], games[12:]]:
+            sink = TrajectorySink(path, compress, batchSize=5)
+            for seed, name, actions, score, win in batch:
+                sink.add(seed, name, actions, score, win)
+            sink.close()
+        read = list(TrajectoryReader(path))
+        self.assertEqual([game[0] for game in read], range(len(games)))
+        self.assertEqual([game[1:] for game in read], games)
+
+    def testRoundTrip(self):
+        self.checkRoundTrip(False)
+
+    def testCompressedRoundTrip(self):
+        self.checkRoundTrip(True)
+
+class PriorityQueueTest(unittest.TestCase):
+    def testOrderAndKeys(self):
+        queue = PriorityQueue()
+        for item, priority in [('a', 3), ('b', 1), ('c', 2), ('d', 1)]:
+            queue.put(item, priority)
+        self.assertTrue(queue.put('e', 5, key='e'))
+        self.assertFalse(queue.put('e', 6, key='e'))
+        self.assertTrue(queue.put('e', 0, key='e'))
+        self.assertEqual(len(queue), 5)
+        self.assertEqual([queue.get() for i in range(6)], ['e', 'b', 'd', 'c', 'a', None])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -12,7 +12,10 @@
 # Pieter Abbeel (pabbeel@cs.berkeley.edu).
 
 
+import sys
 import time
+from util import nearestPoint
+from game import BitGrid
 try: 
     import pacman
 except:
@@ -22,6 +25,9 @@ DRAW_EVERY = 1
 SLEEP_TIME = 0 # This can be overwritten by __init__
 DISPLAY_MOVES = False
 QUIET = False # Supresses output
+FRAME_INTERVAL = 1.0 / 60 # Shortest time between frames drawn on a terminal
+
+BACKGROUND_CACHE = {}
 
 class NullGraphics:
     def initialize(self, state, isBlue = False):
@@ -45,6 +51,144 @@ class NullGraphics:
     def finish(self):
         pass
 
+class TextRenderer:
+    """
+    Draws game states as the text of GameStateData.__str__, without
+    rebuilding the whole board for every frame.
+
+    The walls of each layout are turned into rows of text once and cached;
+    a frame only places the food, capsules and agents on a copy of them.
+    On a terminal the renderer clears the screen once and from then on
+    rewrites just the cells that changed, with ANSI cursor movement.  A
+    frame asked for within FRAME_INTERVAL of the last one is held back and
+    drawn with the next, so nothing is spent on frames nobody could see.
+    Anywhere else, such as a pipe or a file, every frame is written in
+    full, with the same output as printing the state.
+    """
+    def __init__(self, out=None, incremental=None):
+        if out is None: out = sys.stdout
+        if incremental is None:
+            incremental = hasattr(out, 'isatty') and out.isatty() and not DISPLAY_MOVES
+        self.out = out
+        self.incremental = incremental
+        self.buffer = []
+        self.layoutKey = None
+        self.screen = None
+        self.score = None
+        self.pending = None
+        self.lastFrame = 0
+
+    def setLayout(self, layout):
+        walls = layout.walls
+        self.layoutKey = (walls.width, walls.height, walls.bits)
+        if self.layoutKey not in BACKGROUND_CACHE:
+            rows = [''.join([walls[x][y] and '%' or ' ' for x in range(walls.width)]) for y in range(walls.height)]
+            rows.reverse()
+            BACKGROUND_CACHE[self.layoutKey] = rows
+        self.background = BACKGROUND_CACHE[self.layoutKey]
+        self.height = walls.height
+        self.screen = None
+
+    def cells(self, state):
+        """
+        The (column, row) screen position and character of everything on
+        the board that is not a wall or empty, in GameStateData.__str__ order.
+        """
+        height = self.height - 1
+        cells = {}
+        for x, y in state.food.asList():
+            cells[(x, height - y)] = '.'
+        cells.update(self.sprites(state))
+        return cells
+
+    def sprites(self, state):
+        """
+        The cells of the agents and capsules, which are drawn over the food.
+        """
+        height = self.height - 1
+        sprites = {}
+        for agentState in state.agentStates:
+            if agentState == None: continue
+            if agentState.configuration == None: continue
+            x, y = [int( i ) for i in nearestPoint( agentState.configuration.pos )]
+            if agentState.isPacman:
+                sprites[(x, height - y)] = state._pacStr( agentState.configuration.direction )
+            else:
+                sprites[(x, height - y)] = state._ghostStr( agentState.configuration.direction )
+        for x, y in state.capsules:
+            sprites[(x, height - y)] = 'o'
+        return sprites
+
+    def frame(self, state, cells):
+        rows = [list(row) for row in self.background]
+        for (column, row), char in cells.items():
+            rows[row][column] = char
+        return '\n'.join([''.join(row) for row in rows]) + ('\nScore: %d\n' % state.score)
+
+    def draw(self, state, force=False):
+        layout = state.layout
+        if (layout.walls.width, layout.walls.height, layout.walls.bits) != self.layoutKey:
+            self.setLayout(layout)
+        if not self.incremental:
+            self.buffer.append(self.frame(state, self.cells(state)) + '\n')
+            self.flush()
+            return
+        self.pending = state
+        if force or time.time() - self.lastFrame >= FRAME_INTERVAL:
+            self.render()
+            self.flush()
+
+    def charAt(self, position, foodBits, sprites):
+        if position in sprites: return sprites[position]
+        column, row = position
+        if foodBits >> (column * self.height + self.height - 1 - row) & 1: return '.'
+        return self.background[row][column]
+
+    def render(self):
+        """
+        Adds the escape codes that turn the screen into the pending state.
+        Only the food cells whose bits changed and the cells of agents and
+        capsules, before or after, are looked at.
+        """
+        state, self.pending = self.pending, None
+        if state is None: return
+        food, sprites = state.food, self.sprites(state)
+        foodBits = food.bits
+        if self.screen is None:
+            self.buffer.append('\x1b[2J\x1b[H' + self.frame(state, self.cells(state)))
+        else:
+            oldFood, oldSprites = self.screen
+            changed = set(sprites)
+            changed.update(oldSprites)
+            if foodBits != oldFood:
+                difference = BitGrid(food.width, food.height)
+                difference.bits = foodBits ^ oldFood
+                height = self.height - 1
+                changed.update([(x, height - y) for x, y in difference.asList()])
+            for position in sorted(changed, key=lambda position: (position[1], position[0])):
+                char = self.charAt(position, foodBits, sprites)
+                if char != self.charAt(position, oldFood, oldSprites):
+                    self.buffer.append('\x1b[%d;%dH%s' % (position[1] + 1, position[0] + 1, char))
+            if state.score != self.score:
+                self.buffer.append('\x1b[%d;1H\x1b[2KScore: %d' % (self.height + 1, state.score))
+            self.buffer.append('\x1b[%d;1H' % (self.height + 3))
+        self.screen = (foodBits, sprites)
+        self.score = state.score
+        self.lastFrame = time.time()
+
+    def write(self, text):
+        """
+        Adds text that is not a frame, in order with the frames around it.
+        """
+        self.buffer.append(text)
+
+    def flush(self, pending=False):
+        if pending: self.render()
+        if self.buffer:
+            self.out.write(''.join(self.buffer))
+            self.out.flush()
+            self.buffer = []
+
 class PacmanGraphics:
     def __init__(self, speed=None):
         if speed != None:
@@ -52,7 +196,8 @@ class PacmanGraphics:
             SLEEP_TIME = speed
 
     def initialize(self, state, isBlue = False):
-        self.draw(state)
+        self.renderer = TextRenderer()
+        self.renderer.draw(state, True)
         self.pause()
         self.turn = 0
         self.agentCounter = 0
@@ -64,18 +209,21 @@ class PacmanGraphics:
             self.turn += 1
             if DISPLAY_MOVES:
                 ghosts = [pacman.nearestPoint(state.getGhostPosition(i)) for i in range(1, numAgents)]
-                print "%4d) P: %-8s" % (self.turn, str(pacman.nearestPoint(state.getPacmanPosition()))),'| Score: %-5d' % state.score,'| Ghosts:', ghosts
+                self.renderer.write("%4d) P: %-8s | Score: %-5d | Ghosts: %s\n" % (self.turn, str(pacman.nearestPoint(state.getPacmanPosition())), state.score, ghosts))
             if self.turn % DRAW_EVERY == 0:
                 self.draw(state)
                 self.pause()
         if state._win or state._lose:
-            self.draw(state)
+            # The rules report the outcome right after this, below the board
+            self.renderer.draw(state, True)
 
     def pause(self):
-        time.sleep(SLEEP_TIME)
+        if SLEEP_TIME > 0:
+            self.renderer.flush(True)
+            time.sleep(SLEEP_TIME)
 
     def draw(self, state):
-        print state
+        self.renderer.draw(state)
 
     def finish(self):
-        pass
+        self.renderer.flush(True)
@@ -0,0 +1,157 @@
+# trajectories.py
+# ---------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+An append-only file of the Pacman action sequences of many games
+(pacman.py --trajectories FILE).
+
+A TrajectorySink buffers games and appends them batchSize at a time as one
+block.  A block is a header ('PTB1', flags, number of games, payload size)
+followed by its columns, packed with struct in native byte order:
+
+  gameId   uint32   numbered on from the last game already in the file
+  seed     uint64   the seed the game was played with
+  layout   uint16   index into the block's table of layout names
+  length   uint32   number of Pacman actions
+  score    float64  final score
+  win      uint8    1 for a win, 0 for a loss
+  names    the layout names of the block, newline separated
+  actions  uint8    every game's action codes, one after the other
+
+With compress=True the payload of each block is zlib compressed.
+TrajectoryReader streams the games back a block at a time.
+"""
+
+from codec import DIRECTIONS, DIRECTION_CODES
+from array import array
+import os
+import struct
+import zlib
+
+BLOCK = struct.Struct('=4sBII')
+MAGIC = 'PTB1'
+COMPRESSED = 1
+COLUMNS = [('gameId', 'I'), ('seed', 'Q'), ('layout', 'H'), ('length', 'I'), ('score', 'd'), ('win', 'B')]
+
+def packColumn(typecode, values):
+    return struct.pack('=%d%s' % (len(values), typecode), *values)
+
+class TrajectorySink:
+    """
+    Appends games to the trajectory file at path.
+    """
+    def __init__(self, path, compress=False, batchSize=256):
+        self.path = path
+        self.compress = compress
+        self.batchSize = batchSize
+        self.nextId = 0
+        if os.path.exists(path):
+            for block in TrajectoryReader(path).blocks():
+                if len(block['gameId']): self.nextId = max(self.nextId, block['gameId'][-1] + 1)
+        self.games = []
+
+    def add(self, seed, layoutName, actions, score, win):
+        """
+        Buffers a game whose Pacman played actions (Directions, or their
+        codec.DIRECTION_CODES); returns its game id.
+        """
+        if not isinstance(actions, array):
+            actions = array('B', [DIRECTION_CODES.get(action, action) for action in actions])
+        gameId = self.nextId
+        self.nextId += 1
+        self.games.append((gameId, seed, layoutName or '', actions, score, win))
+        if len(self.games) >= self.batchSize: self.flush()
+        return gameId
+
+    def flush(self):
+        """
+        Appends the buffered games to the file as one block.
+        """
+        if not self.games: return
+        names = []
+        for game in self.games:
+            if game[2] not in names: names.append(game[2])
+        values = [[game[0] for game in self.games],
+                  [game[1] for game in self.games],
+                  [names.index(game[2]) for game in self.games],
+                  [len(game[3]) for game in self.games],
+                  [game[4] for game in self.games],
+                  [int(bool(game[5])) for game in self.games]]
+        columns = [packColumn(typecode, column) for (name, typecode), column in zip(COLUMNS, values)]
+        table = '\n'.join(names)
+        actions = array('B')
+        for game in self.games: actions.extend(game[3])
+        payload = ''.join(columns) + struct.pack('=I', len(table)) + table + actions.tostring()
+        flags = 0
+        if self.compress:
+            payload = zlib.compress(payload)
+            flags |= COMPRESSED
+        f = open(self.path, 'ab')
+        try:
+            f.write(BLOCK.pack(MAGIC, flags, len(self.games), len(payload)) + payload)
+        finally:
+            f.close()
+        self.games = []
+
+    def close(self):
+        self.flush()
+
+class TrajectoryReader:
+    """
+    Streams a trajectory file back, as columns a block at a time with
+    blocks() or as one (gameId, seed, layout, actions, score, win) tuple per
+    game by iterating, with actions a list of Directions.
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def blocks(self):
+        f = open(self.path, 'rb')
+        try:
+            while True:
+                header = f.read(BLOCK.size)
+                if len(header) < BLOCK.size: break
+                magic, flags, numGames, size = BLOCK.unpack(header)
+                if magic != MAGIC: raise Exception('%s is not a trajectory file' % self.path)
+                payload = f.read(size)
+                if len(payload) < size: break
+                if flags & COMPRESSED: payload = zlib.decompress(payload)
+                yield self.decodeBlock(payload, numGames)
+        finally:
+            f.close()
+
+    def decodeBlock(self, payload, numGames):
+        block = {}
+        offset = 0
+        for name, typecode in COLUMNS:
+            format = '=%d%s' % (numGames, typecode)
+            block[name] = struct.unpack_from(format, payload, offset)
+            offset += struct.calcsize(format)
+        tableSize = struct.unpack_from('=I', payload, offset)[0]
+        offset += 4
+        names = payload[offset:offset + tableSize].split('\n')
+        offset += tableSize
+        block['layout'] = [names[index] for index in block['layout']]
+        block['actions'] = array('B')
+        block['actions'].fromstring(payload[offset:])
+        return block
+
+    def __iter__(self):
+        for block in self.blocks():
+            start = 0
+            for i in range(len(block['gameId'])):
+                end = start + block['length'][i]
+                actions = [DIRECTIONS[code] for code in block['actions'][start:end]]
+                yield (block['gameId'][i], block['seed'][i], block['layout'][i], actions, block['score'][i], block['win'][i] == 1)
+                start = end